@@ -1,15 +1,128 @@
-from jobs import bq_service_account_auth, update, load
-from meta_marketing import MetaClient
+from page_size import PageSizer
+from job_queue import JobQueue
+from client_registry import ClientRegistry
+from metrics import metrics
 from flask import Flask, request
-from google.cloud import bigquery
+from types import SimpleNamespace
 import os
+import threading
+
+# The ETL modules (pandas, pyarrow, pandera, BigQuery and the table schemas) take seconds to
+# import, so the service can answer before they're loaded. ETL_PRELOAD: 'background' imports
+# them in a thread once the app is up, 'lazy' on the first ETL request, 'eager' before starting
+ETL_PRELOAD = os.environ.get('ETL_PRELOAD', 'background')
+if ETL_PRELOAD not in ['background', 'lazy', 'eager']:
+    raise ValueError("Insert a valid ETL_PRELOAD, 'background', 'lazy' or 'eager'.")
+_etl = None
+_etl_lock = threading.Lock()
+
+def etl():
+    'Returns the ETL functions and classes used by the endpoints, importing their modules the first time.'
+    global _etl
+    with _etl_lock:
+        if _etl is None:
+            with metrics.span('import_etl'):
+                from jobs import bq_service_account_auth, update, load, NEW_ACCOUNT_DAYS
+                from rollups import ROLLUP_LEVELS
+                from meta_marketing import MetaClient
+                from page_cache import PageCache
+                from checkpoints import SQLiteCheckpoints, BigQueryCheckpoints
+                from google.cloud import bigquery
+            _etl = SimpleNamespace(
+                bq_service_account_auth=bq_service_account_auth,
+                update=update,
+                load=load,
+                NEW_ACCOUNT_DAYS=NEW_ACCOUNT_DAYS,
+                ROLLUP_LEVELS=ROLLUP_LEVELS,
+                MetaClient=MetaClient,
+                PageCache=PageCache,
+                SQLiteCheckpoints=SQLiteCheckpoints,
+                BigQueryCheckpoints=BigQueryCheckpoints,
+                bigquery=bigquery
+            )
+    return _etl
 
 app = Flask(__name__)
+# Jobs run in the background, a few at a time, so requests return right away
+job_queue = JobQueue(max_workers=int(os.environ.get('MAX_JOBS', 2)))
+# Authenticated clients reused across requests, keeping their connection pools warm
+clients = ClientRegistry(ttl=float(os.environ.get('CLIENT_TTL', 3600)))
+# Page sizes learned per ad account and endpoint, shared by the clients and saved across runs if a file is given
+page_sizer = PageSizer(os.environ.get('PAGE_SIZES_FILE'))
+# Stage spans are also written as trace events if a file is given
+if os.environ.get('TRACE_FILE'):
+    metrics.trace_to(os.environ['TRACE_FILE'])
+if ETL_PRELOAD == 'eager':
+    etl()
+elif ETL_PRELOAD == 'background':
+    threading.Thread(target=etl, name='etl-preload', daemon=True).start()
+
+def get_meta_client(meta_token: str, cache_dir: str = None):
+    'Returns the MetaClient of the token (validated once, when built) and cache directory, released by enqueue.'
+    return clients.get(
+        ClientRegistry.key('meta', meta_token, cache_dir),
+        lambda: etl().MetaClient(
+            token=meta_token,
+            cache=etl().PageCache(cache_dir) if cache_dir else None,
+            page_sizer=page_sizer,
+            normalize_processes=int(os.environ.get('NORMALIZE_PROCESSES', 0))
+        )
+    )
+
+def get_bq_client(credentials=None):
+    'Returns the BigQuery client of the service account credentials, or the default one, released by enqueue.'
+    if credentials is None:
+        return clients.get(ClientRegistry.key('bigquery'), lambda: etl().bigquery.Client())
+    return clients.get(
+        ClientRegistry.key('bigquery', credentials),
+        lambda: etl().bq_service_account_auth(credentials=credentials)
+    )
+
+def release_clients(kwargs: dict):
+    'Releases the registry clients of a job, so the expired ones can be closed.'
+    clients.release(kwargs['meta_client'])
+    clients.release(kwargs['bq_client'])
+
+def enqueue(kind: str, function, kwargs: dict, priority: int, wait: bool = False):
+    '''
+    Enqueues a job, deduplicated by BQ dataset, and returns the 202 response with its id.
+    The job's clients are released once it finished, or right away if it's a duplicate.
+    wait: waits for the job (or the one it duplicates) to finish and returns its status, 200 if it
+    succeeded and 500 otherwise, for the callers (e.g. Cloud Scheduler) running on request-based CPU.
+    '''
+    key = f"{kwargs['bq_project_id']}.{kwargs['bq_dataset']}"
+    def run(**job_kwargs):
+        try:
+            function(**job_kwargs)
+        finally:
+            release_clients(kwargs)
+    job, created = job_queue.submit(kind, key, run, kwargs, priority=priority)
+    if not created:
+        release_clients(kwargs)
+    if wait:
+        job.wait()
+        status = job.to_dict()
+        return status, 200 if status['status'] == 'succeeded' else 500
+    message = 'Job queued' if created else f'A job for {key} is already {job.status}'
+    return {'message': message, 'job_id': job.id, 'status_url': f'/jobs/{job.id}'}, 202
 
 @app.route('/')
 def home():
     return {'message': 'Service is running'}, 200
 
+# Job status endpoint
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {'message': f'Job {job_id} not found'}, 404
+    return job.to_dict(), 200
+
+# Prometheus metrics endpoint
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Local update enpoint
 @app.route('/update/local', methods=['POST'])
 def local_update():
@@ -19,18 +132,35 @@ def local_update():
     bq_project_id = data.get('bq_project_id')
     bq_dataset = data.get('bq_dataset')
     credentials = data.get('credentials')
+    cache_dir = data.get('cache_dir')
+    append_method = data.get('append_method', 'load')
+    entity_sync = data.get('entity_sync', 'incremental')
+    lookback_days = int(data.get('lookback_days', 0))
+    start = data.get('start')
+    new_account_days = int(data.get('new_account_days', etl().NEW_ACCOUNT_DAYS))
+    rollups = data.get('rollups', list(etl().ROLLUP_LEVELS))
+    rollup_reach = bool(data.get('rollup_reach', False))
+    priority = int(data.get('priority', 1))
+    wait = bool(data.get('wait', False))
     # Credentials
-    meta_client = MetaClient(token=meta_token)
-    bq_client = bq_service_account_auth(credentials=credentials)
+    meta_client = get_meta_client(meta_token, cache_dir)
+    bq_client = get_bq_client(credentials)
     # Update
-    update(
+    kwargs = dict(
         ad_account_ids=ad_account_ids,
         meta_client=meta_client,
         bq_client=bq_client,
         bq_project_id=bq_project_id,
-        bq_dataset=bq_dataset
+        bq_dataset=bq_dataset,
+        append_method=append_method,
+        entity_sync=entity_sync,
+        lookback_days=lookback_days,
+        start=start,
+        new_account_days=new_account_days,
+        rollups=rollups,
+        rollup_reach=rollup_reach
     )
-    return {'message': 'Job executed successfully'}, 200
+    return enqueue('update', etl().update, kwargs, priority, wait)
 
 # Update endpoint
 @app.route('/update', methods=['POST'])
@@ -40,18 +170,34 @@ def cloud_update():
     meta_token = data.get('meta_token')
     bq_project_id = data.get('bq_project_id')
     bq_dataset = data.get('bq_dataset')
+    append_method = data.get('append_method', 'load')
+    entity_sync = data.get('entity_sync', 'incremental')
+    lookback_days = int(data.get('lookback_days', 0))
+    start = data.get('start')
+    new_account_days = int(data.get('new_account_days', etl().NEW_ACCOUNT_DAYS))
+    rollups = data.get('rollups', list(etl().ROLLUP_LEVELS))
+    rollup_reach = bool(data.get('rollup_reach', False))
+    priority = int(data.get('priority', 1))
+    wait = bool(data.get('wait', False))
     # Credentials
-    meta_client = MetaClient(token=meta_token)
-    bq_client = bigquery.Client()
+    meta_client = get_meta_client(meta_token)
+    bq_client = get_bq_client()
     # Update
-    update(
+    kwargs = dict(
         ad_account_ids=ad_account_ids,
         meta_client=meta_client,
         bq_client=bq_client,
         bq_project_id=bq_project_id,
-        bq_dataset=bq_dataset
+        bq_dataset=bq_dataset,
+        append_method=append_method,
+        entity_sync=entity_sync,
+        lookback_days=lookback_days,
+        start=start,
+        new_account_days=new_account_days,
+        rollups=rollups,
+        rollup_reach=rollup_reach
     )
-    return {'message': 'Job executed successfully'}, 200
+    return enqueue('update', etl().update, kwargs, priority, wait)
 
 # Local loading data endpoint
 @app.route('/load/local', methods=['POST'])
@@ -63,21 +209,41 @@ def local_load():
     bq_dataset = data.get('bq_dataset')
     start = data.get('start')
     credentials = data.get('credentials')
+    cache_dir = data.get('cache_dir')
     write_mode = data.get('write_mode', None)
+    window = data.get('window', None)
+    append_method = data.get('append_method', 'load')
+    chunk_days = int(data.get('chunk_days', 30))
+    checkpoints = data.get('checkpoints')
+    rollups = data.get('rollups', list(etl().ROLLUP_LEVELS))
+    rollup_reach = bool(data.get('rollup_reach', False))
+    priority = int(data.get('priority', 0))
+    wait = bool(data.get('wait', False))
     # Credentials
-    meta_client = MetaClient(token=meta_token)
-    bq_client = bq_service_account_auth(credentials=credentials)
-    # Update
-    load(
+    meta_client = get_meta_client(meta_token, cache_dir)
+    bq_client = get_bq_client(credentials)
+    # Checkpoints of the backfill, in a control table of the dataset or a local SQLite file
+    if checkpoints == 'bigquery':
+        checkpoints = etl().BigQueryCheckpoints(bq_client, bq_project_id, bq_dataset)
+    elif checkpoints:
+        checkpoints = etl().SQLiteCheckpoints(checkpoints)
+    # Load
+    kwargs = dict(
         ad_account_ids=ad_account_ids,
         meta_client=meta_client,
         bq_client=bq_client,
         bq_project_id=bq_project_id,
         bq_dataset=bq_dataset,
         start=start,
-        write_mode = write_mode if write_mode else 'truncate'
+        write_mode = write_mode if write_mode else 'truncate',
+        window=window,
+        append_method=append_method,
+        chunk_days=chunk_days,
+        checkpoints=checkpoints,
+        rollups=rollups,
+        rollup_reach=rollup_reach
     )
-    return {'message': 'Job executed successfully'}, 200
+    return enqueue('load', etl().load, kwargs, priority, wait)
 
 # Entry point
 if __name__=='__main__':
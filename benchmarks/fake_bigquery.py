@@ -0,0 +1,120 @@
+'''
+In-process stand-in for the google.cloud.bigquery.Client calls made by jobs.py, recording the
+load jobs and queries instead of sending them. Loaded dataframes are serialized to Parquet, like
+load_table_from_dataframe does, so the sink's CPU cost stays part of the benchmarks.
+'''
+import io
+import threading
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+class FakeJob:
+    def __init__(self, rows: list = None):
+        self.rows = rows if rows else []
+
+    def result(self):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows)
+
+class FakeBigQueryClient:
+    '''
+    Keeps the datasets and tables created (their schema and partitioning), the rows loaded in
+    each and the tables copied, and answers queries with no rows.
+    '''
+    def __init__(self, serialize: bool = True):
+        '''serialize: writes every loaded dataframe to Parquet in memory, as the real client does.'''
+        self.serialize = serialize
+        self.datasets = {}
+        self.tables = {}
+        self.loads = []
+        self.copies = []
+        self.queries = []
+        self.bytes_loaded = 0
+        self._lock = threading.Lock()
+
+    def get_dataset(self, dataset_id):
+        with self._lock:
+            return self.datasets.get(str(dataset_id), bigquery.Dataset(str(dataset_id)))
+
+    def create_dataset(self, dataset, exists_ok: bool = False):
+        dataset_id = f'{dataset.project}.{dataset.dataset_id}'
+        with self._lock:
+            if dataset_id in self.datasets and not exists_ok:
+                raise ValueError(f'Already exists: Dataset {dataset_id}')
+            self.datasets.setdefault(dataset_id, dataset)
+            return self.datasets[dataset_id]
+
+    def delete_dataset(self, dataset_id, delete_contents: bool = False, not_found_ok: bool = False):
+        with self._lock:
+            if self.datasets.pop(str(dataset_id), None) is None and not not_found_ok:
+                raise NotFound(f'Not found: Dataset {dataset_id}')
+            for table_id in [table_id for table_id in self.tables if table_id.startswith(f'{dataset_id}.')]:
+                del self.tables[table_id]
+
+    def copy_table(self, sources, destination, job_config=None):
+        with self._lock:
+            if str(sources) not in self.tables:
+                raise NotFound(f'Not found: Table {sources}')
+            self.tables[str(destination)] = self.tables[str(sources)]
+            self.copies.append({'source': str(sources), 'destination': str(destination)})
+        return FakeJob()
+
+    def get_table(self, table_id):
+        with self._lock:
+            if str(table_id) not in self.tables:
+                raise NotFound(f'Not found: Table {table_id}')
+            return self.tables[str(table_id)]
+
+    def create_table(self, table, exists_ok: bool = False):
+        table_id = f'{table.project}.{table.dataset_id}.{table.table_id}'
+        with self._lock:
+            if table_id in self.tables:
+                if not exists_ok:
+                    raise ValueError(f'Already exists: Table {table_id}')
+                return self.tables[table_id]
+            self.tables[table_id] = table
+            return table
+
+    def delete_table(self, table_id, not_found_ok: bool = False):
+        with self._lock:
+            if self.tables.pop(str(table_id), None) is None and not not_found_ok:
+                raise NotFound(f'Not found: Table {table_id}')
+
+    def query(self, query: str, job_config=None):
+        with self._lock:
+            self.queries.append(query)
+        return FakeJob()
+
+    def insert_rows_json(self, table_id, rows: list):
+        with self._lock:
+            self.loads.append({'table': str(table_id).split('.')[-1], 'disposition': 'STREAM', 'rows': len(rows), 'bytes': 0})
+        return []
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        size = 0
+        if self.serialize:
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False)
+            size = buffer.tell()
+        with self._lock:
+            if str(table_id) not in self.tables:
+                self.tables[str(table_id)] = bigquery.Table(str(table_id), schema=job_config.schema if job_config else None)
+            self.loads.append({
+                'table': str(table_id).split('.')[-1],
+                'disposition': job_config.write_disposition if job_config else None,
+                'rows': df.shape[0],
+                'bytes': size
+            })
+            self.bytes_loaded += size
+        return FakeJob()
+
+    def rows_loaded(self, table: str = None):
+        'Returns the rows loaded into a table (its name, without project and dataset), or into every table.'
+        with self._lock:
+            return sum(load['rows'] for load in self.loads if table is None or load['table'] == table)
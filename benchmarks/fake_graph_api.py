@@ -0,0 +1,321 @@
+'''
+Local stand-in for the Graph API endpoints used by MetaClient, serving synthetic data.
+Covers /me, ad accounts' insights (paged or through async report runs), campaigns, adsets
+and ads (with updated_time filtering and ad counts), and batch requests.
+Latency, page size, ads per account, throttling, transient and data volume errors are
+configurable, and /__stats reports the requests, pages and rows served.
+Usage: python benchmarks/fake_graph_api.py --port 8765 --latency 0.05 --page-size 100
+'''
+import argparse
+import asyncio
+import json
+import threading
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode
+from aiohttp import web
+
+VERSION = 'v22.0'
+ACTION_TYPES = [
+    'page_engagement',
+    'post_engagement',
+    'video_view',
+    'post_reaction',
+    'link_click',
+    'landing_page_view',
+    'lead',
+    'offsite_conversion.fb_pixel_purchase'
+]
+CREATED_TIME = datetime(2023, 1, 1, 10, tzinfo=timezone(timedelta(hours=-3)))
+
+class FakeGraphAPI:
+    '''
+    Synthetic Graph API. Every ad account has `ads` ads (and as many adsets, and campaigns
+    for every 5 ads), each with one insights row per day.
+    '''
+    def __init__(
+        self,
+        latency: float = 0,
+        page_size: int = 100,
+        ads: int = 20,
+        throttle_every: int = 0,
+        throttle_seconds: int = 1,
+        report_polls: int = 1,
+        error_every: int = 0,
+        max_limit: int = 0,
+        max_days: int = 0
+    ):
+        '''
+        latency: seconds waited before answering each request.
+        page_size: rows per page at most, lower than the limit asked by the client.
+        ads: ads of each ad account.
+        throttle_every: every n-th request is rejected with a rate limiting error (0 never).
+        throttle_seconds: time to regain access reported by the rate limiting errors.
+        report_polls: status polls before an async report run completes.
+        error_every: every n-th request fails with a transient 500 error (0 never).
+        max_limit: limit above which a page fails with Meta's data volume error (0 no limit).
+        max_days: days above which a sync insights query fails with the data volume error (0 no limit).
+        '''
+        self.config = {
+            'latency': latency,
+            'page_size': page_size,
+            'ads': ads,
+            'throttle_every': throttle_every,
+            'throttle_seconds': throttle_seconds,
+            'report_polls': report_polls,
+            'error_every': error_every,
+            'max_limit': max_limit,
+            'max_days': max_days
+        }
+        self.reports = {}
+        self.reset()
+
+    def reset(self):
+        self.stats = {'requests': 0, 'pages': 0, 'rows': 0, 'throttled': 0, 'errors': 0, 'batches': 0, 'report_runs': 0}
+
+    # Synthetic data
+    def insights_row(self, account_id: str, day: date, ad: int):
+        seed = (int(account_id) * 7919 + day.toordinal() * 31 + ad) % 100003 if account_id.isdigit() else ad
+        row = {
+            'account_id': account_id,
+            'account_name': f'Account {account_id}',
+            'ad_id': f'{account_id}{ad:05d}',
+            'ad_name': f'Ad {ad}',
+            'objective': 'OUTCOME_LEADS',
+            'optimization_goal': 'LEAD_GENERATION',
+            'impressions': str(seed % 10000),
+            'reach': str(seed % 5000),
+            'spend': f'{(seed % 10000) / 100:.2f}',
+            'actions': [
+                {'action_type': action_type, 'value': str(1 + (seed + i) % 50)}
+                for i, action_type in enumerate(ACTION_TYPES) if (seed + i) % 3
+            ],
+            'date_start': day.isoformat(),
+            'date_stop': day.isoformat()
+        }
+        if seed % 2:
+            for percent in [25, 50, 75, 95, 100]:
+                row[f'video_p{percent}_watched_actions'] = [{'action_type': 'video_view', 'value': str(seed % (percent + 1))}]
+        return row
+
+    def level_row(self, account_id: str, day: date, level: str, index: int):
+        '''Insights row of an adset, campaign or account, with its reach only.'''
+        level_id = account_id if level == 'account' else f'{account_id}{index:05d}'
+        seed = (int(account_id) * 7919 + day.toordinal() * 31 + index) % 100003 if account_id.isdigit() else index
+        return {
+            'account_id': account_id,
+            f'{level}_id': level_id,
+            'reach': str(seed % 20000),
+            'date_start': day.isoformat(),
+            'date_stop': day.isoformat()
+        }
+
+    def insights_rows(self, account_id: str, time_range: str, offset: int, limit: int, level: str = 'ad'):
+        '''Returns the rows of a page of the (day, object of the level) grid of the time range, and the total rows.'''
+        time_range = json.loads(time_range.replace("'", '"'))
+        since = date.fromisoformat(time_range['since'])
+        days = (date.fromisoformat(time_range['until']) - since).days + 1
+        objects = {
+            'ad': self.config['ads'],
+            'adset': self.config['ads'],
+            'campaign': max(1, self.config['ads'] // 5),
+            'account': 1
+        }[level]
+        total = days * objects
+        rows = []
+        for index in range(offset, min(offset + limit, total)):
+            day = since + timedelta(days=index // objects)
+            if level == 'ad':
+                rows.append(self.insights_row(account_id, day, index % objects))
+            else:
+                rows.append(self.level_row(account_id, day, level, index % objects))
+        return rows, total
+
+    def entity_row(self, account_id: str, edge: str, index: int):
+        updated_time = (CREATED_TIME + timedelta(days=index)).strftime('%Y-%m-%dT%H:%M:%S%z')
+        row = {
+            'account_id': account_id,
+            'account_name': f'Account {account_id}',
+            'id': f'{account_id}{index:05d}',
+            'name': f'{edge[:-1]} {index}',
+            'status': 'ACTIVE',
+            'created_time': CREATED_TIME.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'updated_time': updated_time
+        }
+        if edge == 'campaigns':
+            row.update({'objective': 'OUTCOME_LEADS', 'daily_budget': '10000'})
+        elif edge == 'adsets':
+            row.update({
+                'campaign_id': f'{account_id}{index // 5:05d}',
+                'billing_event': 'IMPRESSIONS',
+                'daily_budget': '2000',
+                'destination_type': 'WEBSITE',
+                'optimization_goal': 'LEAD_GENERATION',
+                'promoted_object': {'pixel_id': '1', 'custom_event_type': 'LEAD'}
+            })
+        else:
+            row.update({
+                'adset_id': f'{account_id}{index:05d}',
+                'campaign_id': f'{account_id}{index // 5:05d}',
+                'ad_active_time': str(index * 3600),
+                'creative': {'id': f'9{index:05d}'}
+            })
+        return row
+
+    def entity_rows(self, account_id: str, edge: str, query: dict):
+        count = self.config['ads'] if edge != 'campaigns' else max(1, self.config['ads'] // 5)
+        rows = [self.entity_row(account_id, edge, index) for index in range(count)]
+        if 'filtering' in query:
+            since = json.loads(query['filtering'])[0]['value']
+            rows = [row for row in rows if datetime.strptime(row['updated_time'], '%Y-%m-%dT%H:%M:%S%z').timestamp() > since]
+        return rows
+
+    # Responses
+    def page(self, base: str, path: str, query: dict, rows: list, offset: int, total: int):
+        self.stats['pages'] += 1
+        self.stats['rows'] += len(rows)
+        body = {'data': rows, 'paging': {'cursors': {'after': str(offset + len(rows))}}}
+        if offset + len(rows) < total:
+            next_query = {**query, 'after': str(offset + len(rows))}
+            body['paging']['next'] = f'{base}/{VERSION}/{path}?{urlencode(next_query)}'
+        return 200, body
+
+    def respond(self, base: str, method: str, path: str, query: dict, form: dict):
+        '''Returns the (status, body) of a Graph API request, path being relative to the version.'''
+        parts = path.strip('/').split('/')
+        offset = int(query.get('after', 0))
+        limit = min(int(query.get('limit', 25)), self.config['page_size'])
+        too_much_data = 400, {'error': {
+            'code': 1,
+            'message': "Please reduce the amount of data you're asking for, then retry your request"
+        }}
+        if self.config.get('max_limit') and int(query.get('limit', 0)) > self.config['max_limit']:
+            return too_much_data
+        if self.config.get('max_days') and 'time_range' in query:
+            time_range = json.loads(query['time_range'].replace("'", '"'))
+            days = (date.fromisoformat(time_range['until']) - date.fromisoformat(time_range['since'])).days + 1
+            if days > self.config['max_days']:
+                return too_much_data
+        if parts == ['me']:
+            return 200, {'id': '1', 'name': 'Benchmark User'}
+        if parts == [''] and method == 'POST' and 'batch' in form:
+            self.stats['batches'] += 1
+            items = []
+            for request in json.loads(form['batch']):
+                relative_path, _, relative_query = request['relative_url'].partition('?')
+                status, body = self.respond(base, request['method'], relative_path, dict(parse_qsl(relative_query)), {})
+                items.append({'code': status, 'body': json.dumps(body)})
+            return 200, items
+        if len(parts) == 2 and parts[0].startswith('act_') and parts[1] == 'insights':
+            account_id = parts[0][len('act_'):]
+            if method == 'POST':
+                report_run_id = f'9{len(self.reports):08d}'
+                self.reports[report_run_id] = {
+                    'account_id': account_id,
+                    'time_range': form['time_range'],
+                    'level': form.get('level', 'ad'),
+                    'polls': 0
+                }
+                self.stats['report_runs'] += 1
+                return 200, {'report_run_id': report_run_id}
+            rows, total = self.insights_rows(account_id, query['time_range'], offset, limit, query.get('level', 'ad'))
+            return self.page(base, path.strip('/'), query, rows, offset, total)
+        if len(parts) == 2 and parts[0].startswith('act_'):
+            account_id = parts[0][len('act_'):]
+            if parts[1] == 'ads' and query.get('summary') == 'total_count':
+                return 200, {'data': [], 'summary': {'total_count': self.config['ads']}}
+            rows = self.entity_rows(account_id, parts[1], query)
+            return self.page(base, path.strip('/'), query, rows[offset:offset + limit], offset, len(rows))
+        if parts[0] in self.reports:
+            report = self.reports[parts[0]]
+            if len(parts) == 1:
+                report['polls'] += 1
+                completed = report['polls'] >= self.config['report_polls']
+                return 200, {
+                    'async_status': 'Job Completed' if completed else 'Job Running',
+                    'async_percent_completion': 100 if completed else 50
+                }
+            rows, total = self.insights_rows(report['account_id'], report['time_range'], offset, limit, report['level'])
+            return self.page(base, path.strip('/'), query, rows, offset, total)
+        return 400, {'error': {'code': 100, 'message': f'Unsupported path {path}'}}
+
+    async def handler(self, request):
+        path = request.match_info['path']
+        if path == '__stats':
+            return web.json_response({**self.stats, 'config': self.config})
+        if path == '__reset':
+            self.reset()
+            self.config.update(await request.json() if request.can_read_body else {})
+            return web.json_response({'config': self.config})
+        self.stats['requests'] += 1
+        if self.config['latency']:
+            await asyncio.sleep(self.config['latency'])
+        throttle_every = self.config['throttle_every']
+        if throttle_every and self.stats['requests'] % throttle_every == 0:
+            self.stats['throttled'] += 1
+            headers = {'X-Ad-Account-Usage': json.dumps({
+                'acc_id_util_pct': 100,
+                'reset_time_duration': self.config['throttle_seconds']
+            })}
+            return web.json_response(
+                {'error': {'code': 17, 'message': 'User request limit reached'}},
+                status=400,
+                headers=headers
+            )
+        error_every = self.config.get('error_every')
+        if error_every and self.stats['requests'] % error_every == 0:
+            self.stats['errors'] += 1
+            return web.json_response(
+                {'error': {'code': 2, 'message': 'Service temporarily unavailable', 'is_transient': True}},
+                status=500
+            )
+        form = dict(await request.post()) if request.method == 'POST' else {}
+        relative_path = path[len(VERSION):] if path.startswith(VERSION) else path
+        base = f'{request.scheme}://{request.host}'
+        status, body = self.respond(base, request.method, relative_path, dict(request.query), form)
+        headers = {'X-App-Usage': json.dumps({'call_count': 1, 'total_cputime': 1, 'total_time': 1})}
+        return web.json_response(body, status=status, headers=headers)
+
+    def application(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handler)
+        return app
+
+    def start(self, host: str = '127.0.0.1', port: int = 0):
+        '''Serves the API from a background thread and returns its versioned base url.'''
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(self.application())
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, host, port)
+        loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        return f'http://{host}:{port}/{VERSION}'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--ads', type=int, default=20)
+    parser.add_argument('--throttle-every', type=int, default=0)
+    parser.add_argument('--throttle-seconds', type=int, default=1)
+    parser.add_argument('--report-polls', type=int, default=1)
+    parser.add_argument('--error-every', type=int, default=0)
+    parser.add_argument('--max-limit', type=int, default=0)
+    parser.add_argument('--max-days', type=int, default=0)
+    args = parser.parse_args()
+
+    api = FakeGraphAPI(
+        latency=args.latency,
+        page_size=args.page_size,
+        ads=args.ads,
+        throttle_every=args.throttle_every,
+        throttle_seconds=args.throttle_seconds,
+        report_polls=args.report_polls,
+        error_every=args.error_every,
+        max_limit=args.max_limit,
+        max_days=args.max_days
+    )
+    print(f'Fake Graph API on http://{args.host}:{args.port}/{VERSION}', flush=True)
+    web.run_app(api.application(), host=args.host, port=args.port, print=None)
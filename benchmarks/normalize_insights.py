@@ -0,0 +1,115 @@
+'''
+Benchmarks the normalization of raw ad insights rows into the insights_ads dataframe.
+Compares the former row by row normalizer with meta_marketing.ad_insights_to_df.
+Usage: python benchmarks/normalize_insights.py --rows 100000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from meta_marketing import ad_insights_to_df
+from table_schemas import insights_ads_schema
+
+ACTION_TYPES = [
+    'page_engagement',
+    'post_engagement',
+    'video_view',
+    'post_reaction',
+    'like',
+    'link_click',
+    'landing_page_view',
+    'lead',
+    'onsite_conversion.messaging_conversation_started_7d',
+    'offsite_conversion.fb_pixel_purchase',
+    'comment',
+    'omni_purchase'
+]
+
+def synthetic_rows(rows: int, seed: int = 0):
+    '''Returns raw insights rows shaped like the Graph API ones.'''
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        item = {
+            'date_start': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}',
+            'account_id': '1234',
+            'account_name': 'Account',
+            'ad_id': str(10000 + i % 500),
+            'ad_name': f'Ad {i % 500}',
+            'objective': 'OUTCOME_LEADS',
+            'optimization_goal': 'LEAD_GENERATION',
+            'impressions': str(rng.randint(0, 10000)),
+            'reach': str(rng.randint(0, 5000)),
+            'spend': f'{rng.random() * 100:.2f}',
+            'actions': [
+                {'action_type': action_type, 'value': str(rng.randint(1, 50))}
+                for action_type in rng.sample(ACTION_TYPES, rng.randint(0, len(ACTION_TYPES)))
+            ]
+        }
+        if rng.random() < 0.5:
+            for percent in [25, 50, 75, 95, 100]:
+                item[f'video_p{percent}_watched_actions'] = [{'action_type': 'video_view', 'value': str(rng.randint(0, 100))}]
+        data.append(item)
+    return data
+
+def rowwise_insights_to_df(data: list):
+    '''Row by row normalizer used before the columnar one, kept as the baseline.'''
+    normal_data = []
+    for item in data:
+        try:
+            action_fields = {f"action_{action['action_type']}": action['value'] for action in item['actions']}
+        except KeyError:
+            action_fields = {}
+        normal_item = {
+            'date': item['date_start'],
+            'account_id': item['account_id'],
+            'account_name': item['account_name'],
+            'ad_id': item['ad_id'],
+            'ad_name': item['ad_name'],
+            'objective': item['objective'],
+            'optimization_goal': item['optimization_goal'],
+            'impressions': item.get('impressions', 0),
+            'reach': item.get('reach', 0),
+            'video_p25_watched_actions': item.get('video_p25_watched_actions', [{}])[0].get('value', None),
+            'video_p50_watched_actions': item.get('video_p50_watched_actions', [{}])[0].get('value', None),
+            'video_p75_watched_actions': item.get('video_p75_watched_actions', [{}])[0].get('value', None),
+            'video_p95_watched_actions': item.get('video_p95_watched_actions', [{}])[0].get('value', None),
+            'video_p100_watched_actions': item.get('video_p100_watched_actions', [{}])[0].get('value', None),
+            'spend': item['spend']
+        }
+        normal_item.update(action_fields)
+        normal_data.append(normal_item)
+    df = pd.json_normalize(normal_data)
+    df.columns = [col_name.replace('.', '_') for col_name in df.columns]
+    df['date'] = pd.to_datetime(df['date'])
+    df = insights_ads_schema.validate(df)
+    return df
+
+def best_time(function, data, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = function(data)
+        times.append(time.perf_counter() - start)
+    return min(times), df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = synthetic_rows(args.rows)
+    rowwise_time, rowwise_df = best_time(rowwise_insights_to_df, data, args.repeat)
+    columnar_time, columnar_df = best_time(ad_insights_to_df, data, args.repeat)
+    # The row by row column order depends on the actions found in the data
+    same_output = rowwise_df[columnar_df.columns].equals(columnar_df)
+
+    print(f'rows: {args.rows}')
+    print(f'row by row: {rowwise_time:.3f}s, {args.rows / rowwise_time:,.0f} rows/sec')
+    print(f'columnar:   {columnar_time:.3f}s, {args.rows / columnar_time:,.0f} rows/sec')
+    print(f'speedup: {rowwise_time / columnar_time:.1f}x, same output: {same_output}')
@@ -0,0 +1,187 @@
+'''
+Offline end-to-end benchmarks of the extraction and load paths, against the fake Graph API
+(fake_graph_api.py, served by a separate process) and the fake BigQuery sink (fake_bigquery.py).
+Every scenario runs in its own process, so its peak RSS is measured alone, and reports the wall
+time, pages/sec, rows/sec and peak RSS. Results are appended as JSON lines to --output, to compare
+runs before and after a change.
+Scenarios: extract (jobs.extract_accounts_async) and load (jobs.load), for a grid of accounts x days.
+Usage: python benchmarks/run_scenarios.py --grid quick --latency 0.02 --output results.jsonl
+'''
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import date, timedelta
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+GRIDS = {
+    'quick': {'accounts': [1, 10], 'days': [1, 30]},
+    'full': {'accounts': [1, 10, 100, 1000], 'days': [1, 30, 365]}
+}
+END_DATE = '2024-12-31'
+
+def api_call(base_url: str, path: str, config: dict = None):
+    '''Calls a control endpoint of the fake Graph API (/__stats or /__reset).'''
+    root = base_url.rsplit('/', 1)[0]
+    data = json.dumps(config).encode() if config is not None else None
+    request = urllib.request.Request(f'{root}/{path}', data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def run_scenario(scenario: dict):
+    '''Runs a scenario in the current process and returns its measures.'''
+    from fake_bigquery import FakeBigQueryClient
+    from jobs import extract_accounts_async, load
+    from meta_marketing import MetaClient
+    from throttling import UsageScheduler
+    from retries import RetryPolicy
+    import asyncio
+
+    api_call(scenario['base_url'], '__reset', scenario['api'])
+    ad_account_ids = [str(1000 + i) for i in range(scenario['accounts'])]
+    start = (date.fromisoformat(END_DATE) - timedelta(days=scenario['days'] - 1)).isoformat()
+    meta_client = MetaClient(
+        token='benchmark',
+        base_url=scenario['base_url'],
+        # Throttling errors of the fake API are retried after a short pause
+        scheduler=UsageScheduler(throttle_backoff=0.5),
+        retry=RetryPolicy(base_delay=0.1),
+        normalize_processes=scenario['normalize_processes']
+    )
+    begin = time.perf_counter()
+    if scenario['kind'] == 'extract':
+        tables = asyncio.run(extract_accounts_async(ad_account_ids, meta_client, start, END_DATE, scenario['window']))
+        rows = sum(df.shape[0] for df in tables)
+    else:
+        bq_client = FakeBigQueryClient(serialize=scenario['serialize'])
+        load(
+            ad_account_ids,
+            meta_client,
+            bq_client,
+            'benchmark',
+            'benchmark',
+            start,
+            END_DATE,
+            window=scenario['window'],
+            chunk_days=scenario['chunk_days'],
+            flush_rows=scenario['flush_rows']
+        )
+        rows = bq_client.rows_loaded()
+    wall_time = time.perf_counter() - begin
+    meta_client.close()
+    stats = api_call(scenario['base_url'], '__stats')
+    return {
+        'kind': scenario['kind'],
+        'accounts': scenario['accounts'],
+        'days': scenario['days'],
+        'wall_time': round(wall_time, 3),
+        'requests': stats['requests'],
+        'pages': stats['pages'],
+        'rows': rows,
+        'pages_per_sec': round(stats['pages'] / wall_time, 1),
+        'rows_per_sec': round(rows / wall_time, 1),
+        'throttled': stats['throttled'],
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_api(args):
+    '''Starts the fake Graph API in a separate process, returning the process and its base url.'''
+    port = args.port if args.port else free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, 'fake_graph_api.py'), '--port', str(port)],
+        stdout=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}/v22.0'
+    for _ in range(100):
+        try:
+            api_call(base_url, '__stats')
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Fake Graph API not started.')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', choices=list(GRIDS), default='quick')
+    parser.add_argument('--accounts', type=int, nargs='+', help='overrides the accounts of the grid')
+    parser.add_argument('--days', type=int, nargs='+', help='overrides the days of the grid')
+    parser.add_argument('--kinds', nargs='+', choices=['extract', 'load'], default=['extract', 'load'])
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per fake API request')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--ads', type=int, default=20, help='ads per ad account')
+    parser.add_argument('--throttle-every', type=int, default=0, help='throttles every n-th request, 0 never')
+    parser.add_argument('--error-every', type=int, default=0, help='fails every n-th request with a 500, 0 never')
+    parser.add_argument('--window', default=None, help="insights window, days or 'adaptive'")
+    parser.add_argument('--chunk-days', type=int, default=30)
+    parser.add_argument('--flush-rows', type=int, default=50000, help='rows of the micro-batches loaded')
+    parser.add_argument('--normalize-processes', type=int, default=0)
+    parser.add_argument('--no-serialize', action='store_true', help='skips the Parquet serialization of the loads')
+    parser.add_argument('--port', type=int, default=0, help='fake API port, a free one by default')
+    parser.add_argument('--output', help='JSON lines file the results are appended to')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process running a single scenario
+    if args.scenario:
+        sys.path.insert(0, BENCHMARKS_DIR)
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        sys.exit(0)
+
+    process, base_url = start_api(args)
+    window = int(args.window) if args.window and args.window.isdigit() else args.window
+    try:
+        print(f"{'kind':<8}{'accounts':>9}{'days':>6}{'wall s':>9}{'pages':>8}{'pages/s':>9}{'rows':>10}{'rows/s':>11}{'peak MB':>9}")
+        for kind in args.kinds:
+            for accounts in args.accounts if args.accounts else GRIDS[args.grid]['accounts']:
+                for days in args.days if args.days else GRIDS[args.grid]['days']:
+                    scenario = {
+                        'kind': kind,
+                        'accounts': accounts,
+                        'days': days,
+                        'base_url': base_url,
+                        'window': window,
+                        'chunk_days': args.chunk_days,
+                        'flush_rows': args.flush_rows,
+                        'normalize_processes': args.normalize_processes,
+                        'serialize': not args.no_serialize,
+                        'api': {
+                            'latency': args.latency,
+                            'page_size': args.page_size,
+                            'ads': args.ads,
+                            'throttle_every': args.throttle_every,
+                            'error_every': args.error_every
+                        }
+                    }
+                    child = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), '--scenario', json.dumps(scenario)],
+                        capture_output=True,
+                        text=True
+                    )
+                    if child.returncode != 0:
+                        print(f'{kind} {accounts} accounts x {days} days failed:\n{child.stderr}')
+                        continue
+                    result = json.loads(child.stdout.strip().splitlines()[-1])
+                    print(
+                        f"{kind:<8}{accounts:>9}{days:>6}{result['wall_time']:>9.2f}{result['pages']:>8}"
+                        f"{result['pages_per_sec']:>9.1f}{result['rows']:>10}{result['rows_per_sec']:>11.1f}"
+                        f"{result['peak_rss_mb']:>9.1f}"
+                    )
+                    if args.output:
+                        with open(args.output, 'a') as file:
+                            file.write(json.dumps({**result, 'api': scenario['api'], 'window': window}) + '\n')
+    finally:
+        process.terminate()
@@ -0,0 +1,128 @@
+'''
+Cold start benchmark of the service: for each ETL_PRELOAD mode (see app.py), starts gunicorn
+as the Dockerfile does and measures the seconds until / first answers, until the ETL modules
+are imported (the import_etl stage appears in /metrics) and the slowest / answer meanwhile,
+over --runs runs. With --profile, also prints the modules slowest to import (python -X importtime)
+for `import app` in each mode and for the ETL modules.
+Usage: python benchmarks/startup.py --modes eager background lazy --runs 3 --profile
+'''
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url: str, timeout: float = 5):
+    'Returns the body of a GET request, None if the server is not answering yet.'
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read().decode()
+    except OSError:
+        return None
+
+def run_startup(mode: str, timeout: float = 60):
+    '''Starts the service with an ETL_PRELOAD mode and returns its startup measures.'''
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = {**os.environ, 'ETL_PRELOAD': mode}
+    begin = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '--workers', '1', '--threads', '8', 'app:app'],
+        cwd=REPO_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    first_response = etl_ready = None
+    slowest_ping = 0
+    try:
+        while time.perf_counter() - begin < timeout:
+            ping_start = time.perf_counter()
+            if get(f'{base_url}/') is None:
+                time.sleep(0.01)
+                continue
+            now = time.perf_counter()
+            if first_response is None:
+                first_response = now - begin
+            slowest_ping = max(slowest_ping, now - ping_start)
+            # Lazy mode only imports on an ETL request, so there's nothing to wait for
+            if mode == 'lazy':
+                break
+            if 'stage="import_etl"' in (get(f'{base_url}/metrics') or ''):
+                etl_ready = time.perf_counter() - begin
+                break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    if first_response is None:
+        raise RuntimeError(f'Service not started in {timeout} seconds with ETL_PRELOAD={mode}.')
+    return {
+        'mode': mode,
+        'first_response': round(first_response, 3),
+        'etl_ready': round(etl_ready, 3) if etl_ready is not None else None,
+        'slowest_ping': round(slowest_ping, 3)
+    }
+
+def import_profile(statement: str, mode: str, top: int = 15):
+    '''Returns the (module, cumulative seconds) slowest to import for the statement, from python -X importtime.'''
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=REPO_DIR,
+        env={**os.environ, 'ETL_PRELOAD': mode},
+        capture_output=True,
+        text=True
+    )
+    modules = []
+    for line in child.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda module: -module[1])[:top]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['eager', 'background', 'lazy'], default=['eager', 'background', 'lazy'])
+    parser.add_argument('--runs', type=int, default=3, help='starts measured per mode, the median being reported')
+    parser.add_argument('--profile', action='store_true', help='prints the import time profiles')
+    parser.add_argument('--top', type=int, default=15, help='modules listed by the profiles')
+    parser.add_argument('--output', help='JSON lines file the results are appended to')
+    args = parser.parse_args()
+
+    if args.profile:
+        statements = [(f'import app (ETL_PRELOAD={mode})', 'import app', mode) for mode in args.modes]
+        statements.append(('ETL modules', 'import jobs, meta_marketing, rollups, checkpoints, page_cache', 'lazy'))
+        for title, statement, mode in statements:
+            print(f'{title}:')
+            for name, seconds in import_profile(statement, mode, args.top):
+                print(f'  {seconds:8.3f} s  {name}')
+        print()
+
+    print(f"{'mode':<12}{'first / s':>11}{'etl ready s':>13}{'slowest / s':>13}")
+    for mode in args.modes:
+        runs = [run_startup(mode) for _ in range(args.runs)]
+        etl_ready = [run['etl_ready'] for run in runs if run['etl_ready'] is not None]
+        result = {
+            'mode': mode,
+            'runs': args.runs,
+            'first_response': statistics.median(run['first_response'] for run in runs),
+            'etl_ready': statistics.median(etl_ready) if etl_ready else None,
+            'slowest_ping': max(run['slowest_ping'] for run in runs)
+        }
+        etl_ready = f"{result['etl_ready']:>13.3f}" if result['etl_ready'] is not None else f"{'-':>13}"
+        print(f"{mode:<12}{result['first_response']:>11.3f}{etl_ready}{result['slowest_ping']:>13.3f}")
+        if args.output:
+            with open(args.output, 'a') as file:
+                file.write(json.dumps(result) + '\n')
@@ -0,0 +1,132 @@
+# Importing libraries
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+class SQLiteCheckpoints:
+    '''
+    Checkpoint store of the work units of a job, kept in a local SQLite file.
+    A unit is 'started' before its data is written and 'done' once written.
+    The units of a finished job are deleted, so the same job submitted again starts over.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (job_id, unit)
+            )
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def units(self, job_id: str):
+        '''Returns {unit: status} of the units recorded for the job.'''
+        with self._lock, self._connect() as connection:
+            rows = connection.execute('SELECT unit, status FROM checkpoints WHERE job_id = ?', (job_id,)).fetchall()
+        return dict(rows)
+
+    def mark(self, job_id: str, unit: str, status: str):
+        '''Records the status of a unit of the job.'''
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)',
+                (job_id, unit, status, datetime.now(timezone.utc).isoformat())
+            )
+
+    def finish(self, job_id: str):
+        '''Forgets the units of the job, once it succeeded.'''
+        with self._lock, self._connect() as connection:
+            connection.execute('DELETE FROM checkpoints WHERE job_id = ?', (job_id,))
+
+class BigQueryCheckpoints:
+    '''
+    Checkpoint store of the work units of a job, kept in a control table of a BQ dataset.
+    Statuses are streamed as new rows, the latest one of each unit being its status.
+    A finished job gets a 'finished' row, the units recorded before it being ignored,
+    as rows still in the streaming buffer can't be deleted.
+    '''
+    def __init__(
+        self,
+        client,
+        bq_project_id: str,
+        bq_dataset: str,
+        table: str = '_load_checkpoints',
+        insert_retries: int = 8
+    ):
+        '''
+        insert_retries: times a checkpoint is inserted again while the table just created isn't
+        found yet by the streaming API, waiting twice longer each time (from 1 second).
+        '''
+        self.client = client
+        self.insert_retries = insert_retries
+        self.table_id = f'{bq_project_id}.{bq_dataset}.{table}'
+        self._created = False
+        self._schema = [
+            bigquery.SchemaField('job_id', 'STRING', mode='REQUIRED'),
+            bigquery.SchemaField('unit', 'STRING', mode='REQUIRED'),
+            bigquery.SchemaField('status', 'STRING', mode='REQUIRED'),
+            bigquery.SchemaField('updated_at', 'TIMESTAMP', mode='REQUIRED')
+        ]
+
+    def units(self, job_id: str):
+        '''Returns {unit: status} of the units recorded for the job.'''
+        query = f'''
+        SELECT
+            unit,
+            ARRAY_AGG(status ORDER BY updated_at DESC LIMIT 1)[OFFSET(0)] AS status
+        FROM `{self.table_id}`
+        WHERE job_id = @job_id
+            AND status != 'finished'
+            AND updated_at > (
+                SELECT IFNULL(MAX(updated_at), TIMESTAMP '1970-01-01')
+                FROM `{self.table_id}`
+                WHERE job_id = @job_id AND status = 'finished'
+            )
+        GROUP BY unit
+        '''
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter('job_id', 'STRING', job_id)]
+        )
+        try:
+            rows = self.client.query(query, job_config=job_config).result()
+        except NotFound:
+            return {}
+        return {row['unit']: row['status'] for row in rows}
+
+    def mark(self, job_id: str, unit: str, status: str):
+        '''Records the status of a unit of the job.'''
+        # Created on the first checkpoint, once the job created the dataset
+        if not self._created:
+            self.client.create_table(bigquery.Table(self.table_id, schema=self._schema), exists_ok=True)
+            self._created = True
+        row = {
+            'job_id': job_id,
+            'unit': unit,
+            'status': status,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+        # Streaming inserts into a table created moments ago can fail until the table propagates
+        for retry in range(self.insert_retries + 1):
+            try:
+                errors = self.client.insert_rows_json(self.table_id, [row])
+                break
+            except NotFound:
+                if retry == self.insert_retries:
+                    raise
+                time.sleep(min(2 ** retry, 30))
+        if errors:
+            raise RuntimeError(f'Checkpoint of {unit} not recorded: {errors}')
+
+    def finish(self, job_id: str):
+        '''Forgets the units of the job, once it succeeded.'''
+        self.mark(job_id, '', 'finished')
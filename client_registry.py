@@ -0,0 +1,102 @@
+# Importing libraries
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+class ClientRegistry:
+    '''
+    Keeps authenticated clients across requests, keyed by a hash of their token or credentials.
+    Clients expire after ttl seconds and the least recently used are dropped beyond max_clients.
+    Dropped clients are closed (their close() method, if any) once no job still uses them.
+    '''
+    def __init__(self, ttl: float = 3600, max_clients: int = 32):
+        self.ttl = ttl
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key, so a client is only built once while others are looked up
+        self._key_locks = {}
+        # Uses of the clients returned by get and not released yet, by id(client)
+        self._uses = {}
+        # Clients dropped while still used, closed by their last release
+        self._dropped = {}
+
+    @staticmethod
+    def key(kind: str, *secrets):
+        'Returns the registry key of a client, hashing its secrets so they are never kept in clear.'
+        digest = hashlib.sha256(json.dumps(secrets, sort_keys=True, default=str).encode()).hexdigest()
+        return f'{kind}:{digest}'
+
+    def get(self, key: str, factory):
+        '''
+        Returns the client of the key, building it with factory() if missing or expired.
+        Each call is paired with a release(client) once the client is no longer used.
+        '''
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        closing = []
+        with key_lock:
+            with self._lock:
+                entry = self._clients.get(key)
+                if entry and entry[1] > time.monotonic():
+                    self._clients.move_to_end(key)
+                    self._use(entry[0])
+                    return entry[0]
+            client = factory()
+            with self._lock:
+                if entry:
+                    closing += self._drop(entry[0])
+                self._clients[key] = (client, time.monotonic() + self.ttl)
+                self._clients.move_to_end(key)
+                self._use(client)
+                while len(self._clients) > self.max_clients:
+                    evicted_key, (evicted, _) = self._clients.popitem(last=False)
+                    self._key_locks.pop(evicted_key, None)
+                    closing += self._drop(evicted)
+        self._close(closing)
+        return client
+
+    def release(self, client):
+        '''Ends a use of a client returned by get, closing it if it was dropped meanwhile.'''
+        closing = []
+        with self._lock:
+            uses = self._uses.get(id(client), 0) - 1
+            if uses > 0:
+                self._uses[id(client)] = uses
+            else:
+                self._uses.pop(id(client), None)
+                dropped = self._dropped.pop(id(client), None)
+                if dropped is not None:
+                    closing.append(dropped)
+        self._close(closing)
+
+    def clear(self):
+        closing = []
+        with self._lock:
+            for client, _ in self._clients.values():
+                closing += self._drop(client)
+            self._clients.clear()
+        self._close(closing)
+
+    def _use(self, client):
+        self._uses[id(client)] = self._uses.get(id(client), 0) + 1
+
+    def _drop(self, client):
+        'Returns [client] if it can be closed now, else keeps it until its last release. Called with the lock held.'
+        if self._uses.get(id(client)):
+            self._dropped[id(client)] = client
+            return []
+        return [client]
+
+    @staticmethod
+    def _close(clients):
+        for client in clients:
+            close = getattr(client, 'close', None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                print(f'Client {type(client).__name__} not closed: {e}')
@@ -0,0 +1,128 @@
+# Importing libraries
+import itertools
+import queue
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from metrics import metrics
+
+class Job:
+    'An ETL job run by a JobQueue, with its progress reported by the job function.'
+    def __init__(self, kind: str, key: str, priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.priority = priority
+        self.status = 'queued'
+        self.message = None
+        self.rows = {}
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def report(self, message: str, rows: dict = None):
+        '''Progress callback of the job function: the current step and the rows loaded by table.'''
+        with self._lock:
+            self.message = message
+            for table, table_rows in (rows or {}).items():
+                self.rows[table] = self.rows.get(table, 0) + table_rows
+
+    def wait(self, timeout: float = None):
+        '''Waits until the job finished, or timeout seconds, and returns whether it finished.'''
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at if self.finished_at else datetime.now(timezone.utc)
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'key': self.key,
+                'priority': self.priority,
+                'status': self.status,
+                'message': self.message,
+                'rows': dict(self.rows),
+                'error': self.error,
+                'created_at': self.created_at.isoformat(),
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+                'queued_seconds': ((self.started_at if self.started_at else end) - self.created_at).total_seconds(),
+                'run_seconds': (end - self.started_at).total_seconds() if self.started_at else None
+            }
+
+class JobQueue:
+    '''
+    Runs jobs in a bounded pool of worker threads, higher priorities first.
+    A job is deduplicated while another job with the same key (e.g. the BQ dataset) is queued or running.
+    '''
+    def __init__(self, max_workers: int = 2, max_finished: int = 1000):
+        '''
+        max_workers: jobs run at the same time.
+        max_finished: finished jobs kept for their status, the oldest being forgotten.
+        '''
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+        self._finished = []
+        self._workers = [
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, kind: str, key: str, function, kwargs: dict, priority: int = 0):
+        '''
+        Enqueues function(**kwargs, progress=job.report) and returns (job, created).
+        If a job with the same key is queued or running, it's returned instead with created False.
+        '''
+        with self._lock:
+            if key in self._active:
+                return self._jobs[self._active[key]], False
+            job = Job(kind, key, priority)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+        self._queue.put((-priority, next(self._counter), job, function, kwargs))
+        return job, True
+
+    def get(self, job_id: str):
+        'Returns the job with the id, or None.'
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            _, _, job, function, kwargs = self._queue.get()
+            with job._lock:
+                job.status = 'running'
+                job.started_at = datetime.now(timezone.utc)
+            start = time.monotonic()
+            try:
+                function(**kwargs, progress=job.report)
+                status, error = 'succeeded', None
+            except Exception as e:
+                traceback.print_exc()
+                status, error = 'failed', f'{type(e).__name__}: {e}'
+            with job._lock:
+                job.status = status
+                job.error = error
+                job.finished_at = datetime.now(timezone.utc)
+            job._done.set()
+            metrics.observe('job', time.monotonic() - start, kind=job.kind)
+            metrics.inc('jobs_total', kind=job.kind, status=status)
+            print(f'Job {job.id} ({job.kind} {job.key}) {status} in {time.monotonic() - start:.1f}s.')
+            with self._lock:
+                self._active.pop(job.key, None)
+                self._finished.append(job.id)
+                while len(self._finished) > self.max_finished:
+                    self._jobs.pop(self._finished.pop(0), None)
+            self._queue.task_done()
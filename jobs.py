@@ -1,12 +1,75 @@
 import pandas as pd
+import pyarrow
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 from google.oauth2 import service_account
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
 import re
 import unicodedata
-from meta_marketing import MetaClient
+import uuid
+import time
+from meta_marketing import MetaClient, date_windows, concat_frames
+from metrics import metrics
+from table_schemas import table_schemas
+from rollups import ROLLUP_LEVELS, ad_hierarchy, rollup_insights, check_levels
 import asyncio
 
+# BigQuery types of the pandera dtypes used in table_schemas.py
+BQ_TYPES = {
+    'str': 'STRING',
+    'int64': 'INTEGER',
+    'float64': 'FLOAT',
+    'datetime64[ns]': 'DATETIME'
+}
+
+# Columns identifying a row of each table, matched when merging new rows into a table
+MERGE_KEYS = {
+    'campaigns': ['id'],
+    'adsets': ['id'],
+    'ads': ['id'],
+    'insights_ads': ['date', 'ad_id'],
+    'insights_adsets': ['date', 'adset_id'],
+    'insights_campaigns': ['date', 'campaign_id'],
+    'insights_accounts': ['date', 'account_id'],
+    '_watermarks': ['table_name', 'account_id']
+}
+
+# Partitioning (daily, on a date column) and clustering of the tables created by jobs
+TABLE_PARTITIONING = {
+    'insights_ads': {'field': 'date', 'clustering_fields': ['account_id', 'ad_id']},
+    'insights_adsets': {'field': 'date', 'clustering_fields': ['account_id', 'adset_id']},
+    'insights_campaigns': {'field': 'date', 'clustering_fields': ['account_id', 'campaign_id']},
+    'insights_accounts': {'field': 'date', 'clustering_fields': ['account_id']}
+}
+
+# Insights tables derived from insights_ads by the rollups of the jobs (see rollups.py)
+ROLLUP_TABLES = [config['table'] for config in ROLLUP_LEVELS.values()]
+
+# Control table with the last successful sync of each (table, ad account): the last date
+# loaded for insights_ads, the last updated_time seen for the entity tables
+WATERMARKS_TABLE = '_watermarks'
+WATERMARKS_SCHEMA = [
+    bigquery.SchemaField('table_name', 'STRING', mode='REQUIRED'),
+    bigquery.SchemaField('account_id', 'STRING', mode='REQUIRED'),
+    bigquery.SchemaField('watermark', 'DATETIME', mode='NULLABLE'),
+    bigquery.SchemaField('synced_at', 'TIMESTAMP', mode='NULLABLE')
+]
+
+# Entities updated this long before their watermark are fetched again, merging makes it harmless
+ENTITY_SYNC_OVERLAP = timedelta(hours=1)
+
+# Days until yesterday loaded by updates for the ad accounts without a watermark yet
+NEW_ACCOUNT_DAYS = 30
+
+# Streaming loads: rows buffered before a micro-batch is flushed to BigQuery, the longest (seconds)
+# a buffered batch waits for more rows, batches queued before the extraction waits for the loads,
+# and ad accounts extracted at the same time
+FLUSH_ROWS = 50000
+FLUSH_SECONDS = 30
+MAX_QUEUED_BATCHES = 8
+MAX_EXTRACTING_ACCOUNTS = 50
+
 def text_to_snakecase(text):
     'Takes text input and return in snakecase format.'
     # Normalize the string to decompose characters with accents
@@ -18,6 +81,18 @@ def text_to_snakecase(text):
     snake_text = cleaned_text.lower().replace(' ', '_')
     return snake_text[:40]
 
+def check_account_ids(ad_account_ids: str | list):
+    '''
+    Returns the ad account ids as a list of strings, raising a ValueError unless they're all
+    digits only (without the act_ prefix), as they're placed in the SQL filters of the loads.
+    '''
+    ad_account_ids = [ad_account_ids] if isinstance(ad_account_ids, (str, int)) else ad_account_ids
+    ad_account_ids = [str(account_id) for account_id in ad_account_ids]
+    invalid = [account_id for account_id in ad_account_ids if not re.fullmatch(r'[0-9]+', account_id)]
+    if invalid:
+        raise ValueError(f"Insert valid ad account ids, digits only without the 'act_' prefix: {invalid}")
+    return ad_account_ids
+
 def bq_service_account_auth(credentials):
     '''
     Returns a client object to call the BigQuery API.
@@ -27,8 +102,72 @@ def bq_service_account_auth(credentials):
     client = bigquery.Client(credentials=credentials)
     return client
 
-def df_to_bq(table_id, df, write_mode, client):
-    '''Takes a dataframe and writes it in a BigQuery table.'''
+def bq_schema(table: str, df: pd.DataFrame = None):
+    '''
+    Returns the BigQuery schema of a table, derived from its pandera schema in table_schemas.py.
+    Datetime columns are DATETIME, or TIMESTAMP when the dataframe holds them timezone aware.
+    '''
+    schema = []
+    for col_name, column in table_schemas[table].columns.items():
+        field_type = BQ_TYPES[str(column.dtype)]
+        if field_type == 'DATETIME' and df is not None and col_name in df.columns:
+            if getattr(df[col_name].dtype, 'tz', None) is not None:
+                field_type = 'TIMESTAMP'
+        schema.append(bigquery.SchemaField(col_name, field_type, mode='NULLABLE'))
+    return schema
+
+def ensure_partitioned_table(table_id, table: str, client):
+    '''
+    Makes sure a table listed in TABLE_PARTITIONING exists with its partitioning and clustering.
+    Missing tables are created empty. Existing tables without partitioning are rebuilt with it,
+    keeping their rows.
+    '''
+    partitioning = TABLE_PARTITIONING[table]
+    try:
+        bq_table = client.get_table(table_id)
+    except NotFound:
+        bq_table = bigquery.Table(table_id, schema=bq_schema(table))
+        bq_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field=partitioning['field']
+        )
+        bq_table.clustering_fields = partitioning['clustering_fields']
+        client.create_table(bq_table)
+        print(f'Table {table_id} created partitioned by {partitioning["field"]}.')
+        return
+    if bq_table.time_partitioning and bq_table.time_partitioning.field == partitioning['field']:
+        return
+    query = f'''
+    CREATE OR REPLACE TABLE `{table_id}`
+    PARTITION BY DATE({partitioning['field']})
+    CLUSTER BY {', '.join(partitioning['clustering_fields'])}
+    AS SELECT * FROM `{table_id}`
+    '''
+    client.query(query).result()
+    print(f'Table {table_id} rebuilt partitioned by {partitioning["field"]}.')
+
+def ensure_table(table_id, table: str, client):
+    '''
+    Makes sure a table exists with every column of its schema in table_schemas.
+    Missing tables are created empty and missing columns added to existing ones.
+    '''
+    schema = bq_schema(table)
+    try:
+        bq_table = client.get_table(table_id)
+    except NotFound:
+        client.create_table(bigquery.Table(table_id, schema=schema))
+        return
+    columns = [field.name for field in bq_table.schema]
+    for field in schema:
+        if field.name not in columns:
+            client.query(f'ALTER TABLE `{table_id}` ADD COLUMN IF NOT EXISTS `{field.name}` {field.field_type}').result()
+
+def df_to_bq(table_id, df, write_mode, client, schema=None, partitioning=None):
+    '''
+    Takes a dataframe and writes it in a BigQuery table.
+    schema: list of bigquery.SchemaField, skips the schema inference of the load when given.
+    partitioning: the table's TABLE_PARTITIONING entry, kept by truncating loads.
+    '''
     if write_mode == 'truncate':
         job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
     elif write_mode == 'append':
@@ -39,50 +178,707 @@ def df_to_bq(table_id, df, write_mode, client):
     else:
         print("Invalid write mode value. \nPlease insert 'truncate' or 'append'.")
     if df.shape[0] > 0:
+        job_config.source_format = bigquery.SourceFormat.PARQUET
+        if schema:
+            job_config.schema = schema
+        if partitioning:
+            job_config.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY,
+                field=partitioning['field']
+            )
+            job_config.clustering_fields = partitioning['clustering_fields']
         job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
         job.result()
     else:
         print(df, '\n => Dataframe is empty, no data loaded in bigquery.')
 
+def merge_to_bq(table_id, df, keys, client, schema=None, replace_filter: str = None):
+    '''
+    Upserts a dataframe into an existing BigQuery table: rows matching the keys are updated, the others inserted.
+    The dataframe is loaded to a staging table first, which is dropped after the MERGE.
+    replace_filter: condition on the target rows (alias T) the dataframe replaces entirely. Target rows
+    within it and missing from the dataframe are deleted, and only the partitions within it are scanned.
+    '''
+    if df.shape[0] == 0:
+        if replace_filter:
+            client.query(f'DELETE FROM `{table_id}` T WHERE {replace_filter}').result()
+        print(df, '\n => Dataframe is empty, no data loaded in bigquery.')
+        return
+    staging_id = f'{table_id}__staging_{uuid.uuid4().hex[:8]}'
+    df_to_bq(table_id=staging_id, df=df, write_mode='truncate', client=client, schema=schema)
+    columns = [f'`{col_name}`' for col_name in df.columns]
+    conditions = [f'T.`{key}` = S.`{key}`' for key in keys]
+    if replace_filter:
+        conditions.insert(0, f'({replace_filter})')
+    query = f'''
+    MERGE `{table_id}` T
+    USING `{staging_id}` S
+    ON {' AND '.join(conditions)}
+    WHEN MATCHED THEN
+        UPDATE SET {', '.join(f'{col} = S.{col}' for col in columns)}
+    WHEN NOT MATCHED THEN
+        INSERT ({', '.join(columns)}) VALUES ({', '.join(f'S.{col}' for col in columns)})
+    '''
+    if replace_filter:
+        query += f'''WHEN NOT MATCHED BY SOURCE AND {replace_filter} THEN
+        DELETE
+    '''
+    try:
+        client.query(query).result()
+    finally:
+        client.delete_table(staging_id, not_found_ok=True)
+
+def df_to_bq_storage_write(table_id, df, client, schema, batch_rows: int = 50000):
+    '''
+    Appends a dataframe to a BigQuery table through the Storage Write API default stream, in Arrow format.
+    Requires the optional google-cloud-bigquery-storage package.
+    '''
+    try:
+        from google.cloud import bigquery_storage_v1
+        from google.cloud.bigquery_storage_v1 import types
+    except ImportError:
+        raise ImportError('The Storage Write API needs google-cloud-bigquery-storage, please install it.')
+    if df.shape[0] == 0:
+        print(df, '\n => Dataframe is empty, no data loaded in bigquery.')
+        return
+    # BigQuery takes microsecond timestamps, in UTC for TIMESTAMP columns
+    arrow_fields = []
+    for field in schema:
+        if field.field_type in ['DATETIME', 'TIMESTAMP']:
+            tz = 'UTC' if field.field_type == 'TIMESTAMP' else None
+            arrow_fields.append(pyarrow.field(field.name, pyarrow.timestamp('us', tz=tz)))
+        else:
+            arrow_type = {'STRING': pyarrow.string(), 'INTEGER': pyarrow.int64(), 'FLOAT': pyarrow.float64()}
+            arrow_fields.append(pyarrow.field(field.name, arrow_type[field.field_type]))
+    arrow_schema = pyarrow.schema(arrow_fields)
+    arrow_table = pyarrow.Table.from_pandas(df[arrow_schema.names], schema=arrow_schema, preserve_index=False)
+
+    project, dataset, table = table_id.split('.')
+    write_client = bigquery_storage_v1.BigQueryWriteClient(credentials=client._credentials)
+    write_stream = f'{write_client.table_path(project, dataset, table)}/streams/_default'
+    serialized_schema = types.ArrowSchema(serialized_schema=arrow_schema.serialize().to_pybytes())
+
+    def requests():
+        for i, batch in enumerate(arrow_table.to_batches(max_chunksize=batch_rows)):
+            arrow_rows = types.AppendRowsRequest.ArrowData(
+                rows=types.ArrowRecordBatch(serialized_record_batch=batch.serialize().to_pybytes())
+            )
+            # The writer schema is only sent with the first request of the connection
+            if i == 0:
+                arrow_rows.writer_schema = serialized_schema
+            yield types.AppendRowsRequest(write_stream=write_stream, arrow_rows=arrow_rows)
+
+    for response in write_client.append_rows(requests()):
+        if response.error.code or response.row_errors:
+            raise ValueError(f'Storage Write API append to {table_id} failed: {response.error} {response.row_errors}')
+
+def swap_tables(bq_client, bq_project_id: str, source_dataset: str, bq_dataset: str, tables: list):
+    '''
+    Replaces tables of a dataset by the ones of the same names in another dataset of the same
+    location, with truncating copy jobs run together. Each table is replaced atomically, and the
+    partitioned ones keep their TABLE_PARTITIONING.
+    '''
+    for table in tables:
+        if table in TABLE_PARTITIONING:
+            ensure_partitioned_table(f'{bq_project_id}.{bq_dataset}.{table}', table, bq_client)
+    job_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    copy_jobs = [
+        bq_client.copy_table(
+            f'{bq_project_id}.{source_dataset}.{table}',
+            f'{bq_project_id}.{bq_dataset}.{table}',
+            job_config=job_config
+        )
+        for table in tables
+    ]
+    for copy_job in copy_jobs:
+        copy_job.result()
+    print(f'Tables {", ".join(tables)} of {bq_project_id}.{bq_dataset} replaced.')
+
+def tables_to_bq(
+    dict_tables: dict,
+    bq_project_id: str,
+    bq_dataset: str,
+    write_mode: str | dict,
+    client,
+    append_method: str = 'load',
+    replace_filters: dict = None,
+    loaded: list = None,
+    progress=None
+):
+    '''
+    Writes several dataframes to their BigQuery tables at once, waiting for all the loads together.
+    dict_tables: {table name: dataframe}, the names being keys of table_schemas.
+    write_mode: 'truncate', 'append' or 'merge' (upsert on MERGE_KEYS), or a dict with the write mode of each table.
+    append_method: 'load' (Parquet load jobs) or 'storage_write' for the appends to insights_ads.
+    replace_filters: {table name: filter}, the rows a merged dataframe replaces (see merge_to_bq).
+    loaded: list filled with the tables written successfully, also when another table fails.
+    progress: callback(message, rows) called with {table: rows} as each table is written.
+    '''
+    replace_filters = replace_filters if replace_filters else {}
+    if append_method not in ['load', 'storage_write']:
+        raise ValueError("Insert a valid append method, 'load' or 'storage_write'.")
+    write_modes = write_mode if isinstance(write_mode, dict) else {table: write_mode for table in dict_tables}
+
+    def write_table(table, df):
+        table_id = f'{bq_project_id}.{bq_dataset}.{table}'
+        schema = bq_schema(table, df)
+        with metrics.span('bq_write', table=table, mode=write_modes[table]):
+            if append_method == 'storage_write' and table == 'insights_ads' and write_modes[table] == 'append':
+                df_to_bq_storage_write(table_id=table_id, df=df, client=client, schema=schema)
+            elif write_modes[table] == 'merge':
+                merge_to_bq(
+                    table_id=table_id,
+                    df=df,
+                    keys=MERGE_KEYS[table],
+                    client=client,
+                    schema=schema,
+                    replace_filter=replace_filters.get(table)
+                )
+            else:
+                df_to_bq(
+                    table_id=table_id,
+                    df=df,
+                    write_mode=write_modes[table],
+                    client=client,
+                    schema=schema,
+                    partitioning=TABLE_PARTITIONING.get(table)
+                )
+        metrics.inc('rows_loaded_total', df.shape[0], table=table)
+        print(f'Table {table_id} loaded.')
+        if progress:
+            progress(f'Table {table_id} loaded.', {table: df.shape[0]})
+
+    with ThreadPoolExecutor(max_workers=len(dict_tables) or 1) as executor:
+        futures = [executor.submit(write_table, table, df) for table, df in dict_tables.items()]
+        wait(futures)
+    if loaded is not None:
+        loaded.extend(table for table, future in zip(dict_tables, futures) if future.exception() is None)
+    # Raising the first failure, once every load finished
+    for future in futures:
+        future.result()
+
+def entity_watermarks(bq_client, bq_project_id: str, bq_dataset: str):
+    '''
+    Returns {table: {account_id: last updated_time}} for the campaigns, adsets and ads tables.
+    Tables that don't exist yet or have no updated_time column are left out, needing a full sync.
+    '''
+    watermarks = {}
+    for table in ['campaigns', 'adsets', 'ads']:
+        table_id = f'{bq_project_id}.{bq_dataset}.{table}'
+        try:
+            bq_table = bq_client.get_table(table_id)
+        except NotFound:
+            continue
+        if 'updated_time' not in [field.name for field in bq_table.schema]:
+            continue
+        query = f'''
+        SELECT
+            account_id,
+            MAX(updated_time) AS watermark
+        FROM `{table_id}`
+        GROUP BY account_id
+        '''
+        df_watermarks = bq_client.query(query=query).to_dataframe()
+        watermarks[table] = {
+            account_id: watermark
+            for account_id, watermark in zip(df_watermarks['account_id'], df_watermarks['watermark'])
+            if not pd.isna(watermark)
+        }
+    return watermarks
+
+def read_watermarks(bq_client, bq_project_id: str, bq_dataset: str):
+    '''
+    Returns {table: {account_id: watermark}} from the watermarks table of the dataset.
+    The first time, the table is created from the data already loaded: the last date of each
+    account in insights_ads and the last updated_time of each account in the entity tables.
+    '''
+    table_id = f'{bq_project_id}.{bq_dataset}.{WATERMARKS_TABLE}'
+    watermarks = {}
+    try:
+        bq_client.get_table(table_id)
+    except NotFound:
+        watermarks = entity_watermarks(bq_client, bq_project_id, bq_dataset)
+        insights_id = f'{bq_project_id}.{bq_dataset}.insights_ads'
+        try:
+            bq_client.get_table(insights_id)
+        except NotFound:
+            return watermarks
+        query = f'''
+        SELECT
+            account_id,
+            MAX(date) AS watermark
+        FROM `{insights_id}`
+        GROUP BY account_id
+        '''
+        df_watermarks = bq_client.query(query=query).to_dataframe()
+        watermarks['insights_ads'] = dict(zip(df_watermarks['account_id'], df_watermarks['watermark']))
+        write_watermarks(bq_client, bq_project_id, bq_dataset, watermarks)
+        print(f'Table {table_id} created from the loaded data.')
+        return watermarks
+    query = f'''
+    SELECT
+        table_name,
+        account_id,
+        watermark
+    FROM `{table_id}`
+    '''
+    df_watermarks = bq_client.query(query=query).to_dataframe()
+    for table, account_id, watermark in zip(
+        df_watermarks['table_name'], df_watermarks['account_id'], df_watermarks['watermark']
+    ):
+        if not pd.isna(watermark):
+            watermarks.setdefault(table, {})[account_id] = watermark
+    return watermarks
+
+def write_watermarks(bq_client, bq_project_id: str, bq_dataset: str, watermarks: dict, replace_tables: list = None):
+    '''
+    Upserts {table: {account_id: watermark}} into the watermarks table of the dataset, creating it if needed.
+    replace_tables: tables whose watermarks are replaced entirely, dropping the accounts not given.
+    '''
+    table_id = f'{bq_project_id}.{bq_dataset}.{WATERMARKS_TABLE}'
+    bq_client.create_table(bigquery.Table(table_id, schema=WATERMARKS_SCHEMA), exists_ok=True)
+    df_watermarks = pd.DataFrame(
+        [
+            (table, account_id, watermark)
+            for table, table_watermarks in watermarks.items()
+            for account_id, watermark in table_watermarks.items()
+        ],
+        columns=['table_name', 'account_id', 'watermark']
+    )
+    df_watermarks['watermark'] = pd.to_datetime(df_watermarks['watermark'])
+    df_watermarks['synced_at'] = pd.Timestamp.now(tz='UTC')
+    replace_filter = None
+    if replace_tables:
+        tables = ', '.join(f"'{table}'" for table in replace_tables)
+        replace_filter = f'T.table_name IN ({tables})'
+    merge_to_bq(
+        table_id=table_id,
+        df=df_watermarks,
+        keys=MERGE_KEYS[WATERMARKS_TABLE],
+        client=bq_client,
+        schema=WATERMARKS_SCHEMA,
+        replace_filter=replace_filter
+    )
+
+def updated_time_watermarks(df: pd.DataFrame):
+    'Returns {account_id: last updated_time} of an entity dataframe.'
+    if df.shape[0] == 0 or 'updated_time' not in df.columns:
+        return {}
+    return df.groupby('account_id')['updated_time'].max().dropna().to_dict()
+
 def extract_account(
     ad_account_id: str, 
     meta_client, 
     start: str,
-    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d')
+    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d'),
+    window: str | int = None,
+    updated_since: dict = None
 ):
-    df_campaigns = meta_client.df_from_campaigns(ad_account_id=ad_account_id)
-    df_adsets = meta_client.df_from_adsets(ad_account_id=ad_account_id)
-    df_ads = meta_client.df_from_ads(ad_account_id=ad_account_id)
-    df_insights = meta_client.df_from_ad_insights(start=start, end=end, ad_account_id=ad_account_id)
+    '''
+    Extracts the entities and ad insights of an ad account.
+    updated_since: {table: datetime}, only entities updated after it are fetched for the tables given.
+    '''
+    updated_since = updated_since if updated_since else {}
+    df_campaigns = meta_client.df_from_campaigns(ad_account_id=ad_account_id, updated_since=updated_since.get('campaigns'))
+    df_adsets = meta_client.df_from_adsets(ad_account_id=ad_account_id, updated_since=updated_since.get('adsets'))
+    df_ads = meta_client.df_from_ads(ad_account_id=ad_account_id, updated_since=updated_since.get('ads'))
+    df_insights = meta_client.df_from_ad_insights(start=start, end=end, ad_account_id=ad_account_id, window=window)
     return (df_campaigns, df_adsets, df_ads, df_insights)
 
 async def extract_account_async(
     ad_account_id: str, 
     meta_client, 
     start: str,
-    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d')
+    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d'),
+    window: str | int = None,
+    updated_since: dict = None
 ):
-    return await asyncio.to_thread(extract_account, ad_account_id, meta_client, start, end)
+    updated_since = updated_since if updated_since else {}
+    return tuple(await asyncio.gather(
+        meta_client.df_from_campaigns_async(ad_account_id=ad_account_id, updated_since=updated_since.get('campaigns')),
+        meta_client.df_from_adsets_async(ad_account_id=ad_account_id, updated_since=updated_since.get('adsets')),
+        meta_client.df_from_ads_async(ad_account_id=ad_account_id, updated_since=updated_since.get('ads')),
+        meta_client.df_from_ad_insights_async(start=start, end=end, ad_account_id=ad_account_id, window=window)
+    ))
 
 async def extract_accounts_async(
     ad_account_ids: str | list, 
     meta_client, 
-    start: str,
-    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d')
+    start: str | dict,
+    end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d'),
+    window: str | int = None,
+    updated_since: dict = None
 ):
+    '''
+    Extracts several ad accounts concurrently and concatenates their tables.
+    The entities of every account are fetched together with batch requests.
+    start: first date of the insights, or {account_id: first date}.
+    updated_since: {table: {account_id: datetime}}, see extract_account.
+    '''
     ad_account_ids = [ad_account_ids] if isinstance(ad_account_ids, str) else ad_account_ids
-    extractions = [extract_account_async(id, meta_client, start, end) for id in ad_account_ids]
-    extracted_data = await asyncio.gather(*extractions)
+    updated_since = updated_since if updated_since else {}
+    entity_tables = ['campaigns', 'adsets', 'ads']
+    insights_extractions = [
+        meta_client.df_from_ad_insights_async(
+            start=start[id] if isinstance(start, dict) else start,
+            end=end,
+            ad_account_id=id,
+            window=window
+        )
+        for id in ad_account_ids
+    ]
+    try:
+        *entity_data, insights_list = await asyncio.gather(
+            *[
+                meta_client.entities_batch_async(table, ad_account_ids, updated_since.get(table))
+                for table in entity_tables
+            ],
+            asyncio.gather(*insights_extractions)
+        )
+    finally:
+        # The connection pool is bound to this event loop, so it's closed with it
+        await meta_client.aclose()
 
-    campaigns_list, adsets_list, ads_list, insights_list = zip(*extracted_data)
+    entity_frames = {}
+    for table, (frames, errors) in zip(entity_tables, entity_data):
+        if errors:
+            account_id, error = next(iter(errors.items()))
+            raise KeyError(f'{table} of ad account {account_id} not extracted: {error}')
+        entity_frames[table] = [frames[id] for id in ad_account_ids]
 
-    df_campaigns = pd.concat(campaigns_list, ignore_index=True)
-    df_adsets = pd.concat(adsets_list, ignore_index=True)
-    df_ads = pd.concat(ads_list, ignore_index=True)
-    df_insights = pd.concat(insights_list, ignore_index=True)
+    with metrics.span('concat'):
+        df_campaigns = pd.concat(entity_frames['campaigns'], ignore_index=True)
+        df_adsets = pd.concat(entity_frames['adsets'], ignore_index=True)
+        df_ads = pd.concat(entity_frames['ads'], ignore_index=True)
+        df_insights = pd.concat(insights_list, ignore_index=True)
 
     return df_campaigns, df_adsets, df_ads, df_insights
 
+async def fetch_entities_async(meta_client, ad_account_ids: list, updated_since: dict = None):
+    '''
+    Fetches the campaigns, adsets and ads of the ad accounts together, with batch requests.
+    Returns {table: (frames, errors)} as returned by MetaClient.entities_batch_async.
+    '''
+    updated_since = updated_since if updated_since else {}
+    entity_tables = ['campaigns', 'adsets', 'ads']
+    entity_data = await asyncio.gather(*[
+        meta_client.entities_batch_async(table, ad_account_ids, updated_since.get(table)) for table in entity_tables
+    ])
+    return dict(zip(entity_tables, entity_data))
+
+def account_entities(entities: dict, account_id: str):
+    'Returns {table: dataframe} of an ad account from fetch_entities_async, raising its error if one failed.'
+    dict_tables = {}
+    for table, (frames, errors) in entities.items():
+        if account_id in errors:
+            raise errors[account_id]
+        dict_tables[table] = frames[account_id]
+    return dict_tables
+
+def read_ad_hierarchy(bq_client, bq_project_id: str, bq_dataset: str, ad_account_ids: list):
+    '''
+    Returns the adset and campaign of the ads of the accounts stored in the ads table (see
+    rollups.ad_hierarchy), for the accounts whose ads aren't all fetched again.
+    '''
+    if not ad_account_ids:
+        return ad_hierarchy()
+    ad_account_ids = check_account_ids(ad_account_ids)
+    table_id = f'{bq_project_id}.{bq_dataset}.ads'
+    try:
+        bq_client.get_table(table_id)
+    except NotFound:
+        return ad_hierarchy()
+    accounts = ', '.join(f"'{account_id}'" for account_id in ad_account_ids)
+    query = f'''
+    SELECT
+        id,
+        adset_id,
+        campaign_id
+    FROM `{table_id}`
+    WHERE account_id IN ({accounts})
+    '''
+    return ad_hierarchy(bq_client.query(query=query).to_dataframe())
+
+async def insights_tables_async(
+    meta_client,
+    df_insights: pd.DataFrame,
+    hierarchy: pd.DataFrame,
+    rollups: list,
+    rollup_reach: bool,
+    start: str,
+    end: str,
+    ad_account_id: str
+):
+    '''
+    Returns {table: dataframe} of an account's ad insights and their rollups to the levels given.
+    rollup_reach: fetches the reach of each level from the API, left null otherwise.
+    '''
+    dict_tables = {'insights_ads': df_insights}
+    for level in rollups:
+        df_reach = None
+        if rollup_reach and df_insights.shape[0] > 0:
+            df_reach = await meta_client.df_from_insights_reach_async(level, start, end, ad_account_id)
+        dict_tables[ROLLUP_LEVELS[level]['table']] = rollup_insights(df_insights, hierarchy, level, df_reach)
+    return dict_tables
+
+async def stream_to_bq_async(
+    ad_account_ids: list,
+    extract_unit,
+    bq_client,
+    bq_project_id: str,
+    bq_dataset: str,
+    append_method: str = 'load',
+    checkpoints=None,
+    job_id: str = None,
+    flush_rows: int = FLUSH_ROWS,
+    flush_seconds: float = FLUSH_SECONDS,
+    max_accounts: int = MAX_EXTRACTING_ACCOUNTS,
+    progress=None
+):
+    '''
+    Extracts ad accounts and loads them to BigQuery as a producer/consumer pipeline.
+    extract_unit(account_id, put): coroutine extracting an account, passing each finished batch
+    to `await put(batch)`, a dict with:
+        tables: {table: dataframe}, write_modes: {table: 'append' or 'merge'},
+        replace_filters: {table: filter} (optional, see merge_to_bq), scoped to the batch's rows,
+        unit: checkpoint unit done once the batch is loaded (optional),
+        watermarks: {table: watermark} of the account, kept once the table is loaded (optional).
+    Batches are buffered and flushed together (one write per table) once flush_rows rows are
+    buffered or the oldest waited flush_seconds, while the other accounts are still extracted.
+    The queue of batches is bounded, so extraction waits for the loads when they fall behind.
+    Returns the watermarks loaded, {table: {account_id: watermark}}, and {account_id: error}
+    of the accounts whose extraction or load failed, their following batches being dropped.
+    A batch whose checkpoint or progress report fails fails its account too, the queue still draining.
+    '''
+    queue = asyncio.Queue(maxsize=MAX_QUEUED_BATCHES)
+    accounts = asyncio.Semaphore(max_accounts)
+    done = object()
+    errors = {}
+    watermarks = {}
+    batches_loaded = 0
+
+    async def flush(batches):
+        nonlocal batches_loaded
+        units = [batch['unit'] for batch in batches if batch.get('unit')]
+        if checkpoints:
+            for unit in units:
+                await asyncio.to_thread(checkpoints.mark, job_id, unit, 'started')
+        # Batches of a table with the same write mode are written together, their filters combined
+        groups = {}
+        for batch in batches:
+            for table, df in batch['tables'].items():
+                replace_filter = batch.get('replace_filters', {}).get(table)
+                group = groups.setdefault((table, batch['write_modes'][table], replace_filter is not None), [[], []])
+                group[0].append(df)
+                if replace_filter is not None:
+                    group[1].append(f'({replace_filter})')
+        # Each table appears once in a tables_to_bq call
+        rounds = []
+        for key in groups:
+            for round in rounds:
+                if key[0] not in [other[0] for other in round]:
+                    round.append(key)
+                    break
+            else:
+                rounds.append([key])
+        group_errors = {}
+        for round in rounds:
+            loaded = []
+            try:
+                await asyncio.to_thread(
+                    tables_to_bq,
+                    dict_tables={key[0]: concat_frames(groups[key][0]) for key in round},
+                    bq_project_id=bq_project_id,
+                    bq_dataset=bq_dataset,
+                    write_mode={key[0]: key[1] for key in round},
+                    client=bq_client,
+                    append_method=append_method,
+                    replace_filters={key[0]: '(' + ' OR '.join(groups[key][1]) + ')' for key in round if groups[key][1]},
+                    loaded=loaded,
+                    progress=progress
+                )
+            except Exception as exception:
+                group_errors.update({key: exception for key in round if key[0] not in loaded})
+        for batch in batches:
+            keys = [
+                (table, batch['write_modes'][table], batch.get('replace_filters', {}).get(table) is not None)
+                for table in batch['tables']
+            ]
+            for table, key in zip(batch['tables'], keys):
+                watermark = batch.get('watermarks', {}).get(table)
+                if key not in group_errors and watermark is not None and not pd.isna(watermark):
+                    watermarks.setdefault(table, {})[batch['account_id']] = watermark
+            failed = [group_errors[key] for key in keys if key in group_errors]
+            if failed:
+                errors.setdefault(batch['account_id'], failed[0])
+            else:
+                if checkpoints and batch.get('unit'):
+                    await asyncio.to_thread(checkpoints.mark, job_id, batch['unit'], 'done')
+                batches_loaded += 1
+        if progress:
+            progress(f'{batches_loaded} batches loaded, {len(errors)} ad accounts failed.')
+
+    async def flush_batches(batches):
+        try:
+            await flush(batches)
+        except Exception as exception:
+            for batch in batches:
+                errors.setdefault(batch['account_id'], exception)
+
+    async def consume():
+        buffer, buffered_rows, deadline = [], 0, None
+        getter = None
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timeout = max(0, deadline - time.monotonic()) if buffer else None
+            await asyncio.wait([getter], timeout=timeout)
+            if not getter.done():
+                await flush_batches(buffer)
+                buffer, buffered_rows = [], 0
+                continue
+            batch, getter = getter.result(), None
+            if batch is done:
+                break
+            # Batches of an account failed meanwhile aren't loaded
+            if batch['account_id'] in errors:
+                continue
+            if not buffer:
+                deadline = time.monotonic() + flush_seconds
+            buffer.append(batch)
+            buffered_rows += sum(df.shape[0] for df in batch['tables'].values())
+            if buffered_rows >= flush_rows:
+                await flush_batches(buffer)
+                buffer, buffered_rows = [], 0
+        if buffer:
+            await flush_batches(buffer)
+
+    async def produce(account_id):
+        async def put(batch):
+            # The extraction stops once a batch of the account failed to load
+            if account_id in errors:
+                raise errors[account_id]
+            await queue.put({**batch, 'account_id': account_id})
+        async with accounts:
+            try:
+                await extract_unit(account_id, put)
+            except Exception as exception:
+                errors.setdefault(account_id, exception)
+
+    async def extract():
+        await asyncio.gather(*[produce(account_id) for account_id in ad_account_ids])
+        await queue.put(done)
+
+    # A failed consumer cancels the extraction, instead of leaving it waiting on the full queue
+    extraction = asyncio.ensure_future(extract())
+    consumer = asyncio.ensure_future(consume())
+    try:
+        finished, _ = await asyncio.wait([extraction, consumer], return_when=asyncio.FIRST_EXCEPTION)
+        for task in finished:
+            task.result()
+    finally:
+        extraction.cancel()
+        consumer.cancel()
+    return watermarks, errors
+
+async def load_units_async(
+    ad_account_ids: list,
+    meta_client,
+    bq_client,
+    bq_project_id: str,
+    bq_dataset: str,
+    start: str,
+    end: str,
+    window: str | int = None,
+    append_method: str = 'load',
+    chunk_days: int = 30,
+    checkpoints=None,
+    job_id: str = None,
+    progress=None,
+    flush_rows: int = FLUSH_ROWS,
+    rollups: list = (),
+    rollup_reach: bool = False
+):
+    '''
+    Extracts and loads the work units of a backfill: the entities of each ad account, and
+    its insights by chunks of chunk_days days. Accounts are extracted concurrently and the
+    units streamed to BigQuery in micro-batches (see stream_to_bq_async), the units done in
+    checkpoints being skipped.
+    Returns the watermarks of the accounts fully loaded and the failures of the others.
+    progress: callback(message, rows) reporting the batches and rows loaded.
+    rollups/rollup_reach: insights levels rolled up with each chunk, see insights_tables_async.
+    '''
+    units = checkpoints.units(job_id) if checkpoints else {}
+
+    async def extract_unit(account_id, put):
+        unit = f'{account_id}:entities'
+        if units.get(unit) != 'done':
+            dict_tables = account_entities(entities, account_id)
+            # The account's entities replace the ones of a previous load
+            account_filter = f"T.account_id = '{account_id}'"
+            await put({
+                'unit': unit,
+                'tables': dict_tables,
+                'write_modes': {table: 'merge' for table in dict_tables},
+                'replace_filters': {table: account_filter for table in dict_tables},
+                'watermarks': {table: updated_time_watermarks(df).get(account_id) for table, df in dict_tables.items()}
+            })
+        for chunk_start, chunk_end in date_windows(start, end, chunk_days):
+            unit = f'{account_id}:insights:{chunk_start}:{chunk_end}'
+            if units.get(unit) == 'done':
+                continue
+            df_insights = await meta_client.df_from_ad_insights_async(
+                start=chunk_start,
+                end=chunk_end,
+                ad_account_id=account_id,
+                window=window
+            )
+            dict_tables = await insights_tables_async(
+                meta_client, df_insights, hierarchy, rollups, rollup_reach, chunk_start, chunk_end, account_id
+            )
+            batch = {'unit': unit, 'tables': dict_tables, 'write_modes': {table: 'append' for table in dict_tables}}
+            # A unit started by a failed run may be partly loaded, so its rows are replaced instead
+            if units.get(unit) == 'started':
+                chunk_filter = f"DATE(T.date) BETWEEN '{chunk_start}' AND '{chunk_end}' AND T.account_id = '{account_id}'"
+                batch['write_modes'] = {table: 'merge' for table in dict_tables}
+                batch['replace_filters'] = {table: chunk_filter for table in dict_tables}
+            await put(batch)
+
+    # Entities of the accounts not loaded yet, fetched together with batch requests
+    pending_ids = [id for id in ad_account_ids if units.get(f'{id}:entities') != 'done']
+    try:
+        entities = await fetch_entities_async(meta_client, pending_ids)
+        # Ads of the accounts whose entities were loaded by a previous run are read back
+        hierarchy = None
+        if rollups:
+            done_ids = [id for id in ad_account_ids if id not in pending_ids]
+            hierarchy = ad_hierarchy(
+                await asyncio.to_thread(read_ad_hierarchy, bq_client, bq_project_id, bq_dataset, done_ids),
+                *entities['ads'][0].values()
+            )
+        watermarks, errors = await stream_to_bq_async(
+            ad_account_ids,
+            extract_unit,
+            bq_client,
+            bq_project_id,
+            bq_dataset,
+            append_method=append_method,
+            checkpoints=checkpoints,
+            job_id=job_id,
+            flush_rows=flush_rows,
+            progress=progress
+        )
+    finally:
+        await meta_client.aclose()
+
+    # Only the accounts fully loaded keep their watermarks
+    for table in list(watermarks):
+        watermarks[table] = {id: watermark for id, watermark in watermarks[table].items() if id not in errors}
+    watermarks['insights_ads'] = {
+        id: datetime.strptime(end, '%Y-%m-%d') for id in ad_account_ids if id not in errors
+    }
+    return watermarks, list(errors.values())
+
 def load(
     ad_account_ids: str | list,
     meta_client,
@@ -91,82 +887,257 @@ def load(
     bq_dataset: str,
     start: str,
     end: str = (datetime.today() - timedelta(1)).strftime('%Y-%m-%d'),
-    write_mode: str = 'truncate'
+    write_mode: str = 'truncate',
+    window: str | int = None,
+    append_method: str = 'load',
+    chunk_days: int = 30,
+    checkpoints=None,
+    job_id: str = None,
+    progress=None,
+    flush_rows: int = FLUSH_ROWS,
+    rollups: list = tuple(ROLLUP_LEVELS),
+    rollup_reach: bool = False
 ):
-    'Loads data from a list of ad account into a BQ dataset.'
-    # Creating dataset if it doesn't exist yet (it will be overwritten if exists)
+    '''
+    Loads data from a list of ad account into a BQ dataset.
+    The backfill is split in work units loaded as soon as they're extracted (see load_units_async).
+    write_mode: 'truncate' replaces the tables of the dataset by the data of the job, 'append' adds it.
+    checkpoints: checkpoint store (see checkpoints.py). Rerunning a failed job skips its units done,
+    while a job that succeeded is finished in the store and starts over if submitted again.
+    A truncating job with checkpoints empties the tables when it starts, so it can resume into them.
+    Without checkpoints, it loads a staging dataset instead, whose tables replace the dataset's
+    ones once every account is loaded, a failed job leaving them untouched.
+    job_id: identifies the job in the checkpoint store, by default its dataset, dates and write mode.
+    progress: callback(message, rows) reporting the units and rows loaded.
+    flush_rows: rows of the micro-batches loaded while the extraction goes on.
+    rollups: levels ('adset', 'campaign', 'account') whose insights tables are rolled up
+    locally from the ad insights, at no extra API cost.
+    rollup_reach: fetches the reach of the rollup levels from the API, as it can't be summed.
+    '''
     if write_mode not in ['append', 'truncate']:
         raise ValueError("Insert a valid write mode, 'append' or 'truncate'.")
+    check_levels(rollups)
+    ad_account_ids = check_account_ids(ad_account_ids)
+    job_id = job_id if job_id else f'{bq_project_id}.{bq_dataset}:{start}:{end}:{write_mode}'
     
+    # Creating dataset if it doesn't exist yet
     dataset_query = f'''CREATE SCHEMA IF NOT EXISTS `{bq_project_id}.{bq_dataset}`'''
-    bq_client.query(dataset_query)
-    # Extracting data to dataframes
-    df_campaigns, df_adsets, df_ads, df_insights = asyncio.run(
-        extract_accounts_async(
-            ad_account_ids, 
-            meta_client, 
-            start,
-            end
+    bq_client.query(dataset_query).result()
+    resumed = bool(checkpoints and checkpoints.units(job_id))
+    rollup_tables = [ROLLUP_LEVELS[level]['table'] for level in rollups]
+    tables = ['campaigns', 'adsets', 'ads', 'insights_ads'] + rollup_tables
+    # A truncating job without checkpoints can't resume, so it loads a staging dataset swapped in at the end
+    staged = write_mode == 'truncate' and not checkpoints
+    load_dataset = f'{bq_dataset}__load_{uuid.uuid4().hex[:8]}' if staged else bq_dataset
+    if staged:
+        dataset = bigquery.Dataset(f'{bq_project_id}.{load_dataset}')
+        # Copy jobs need both datasets in the same location
+        dataset.location = bq_client.get_dataset(f'{bq_project_id}.{bq_dataset}').location
+        bq_client.create_dataset(dataset)
+    elif write_mode == 'truncate' and not resumed:
+        # Tables are truncated once, when the job starts
+        for table in tables:
+            bq_client.delete_table(f'{bq_project_id}.{bq_dataset}.{table}', not_found_ok=True)
+    try:
+        for table in ['campaigns', 'adsets', 'ads']:
+            ensure_table(f'{bq_project_id}.{load_dataset}.{table}', table, bq_client)
+        for table in ['insights_ads'] + rollup_tables:
+            ensure_partitioned_table(f'{bq_project_id}.{load_dataset}.{table}', table, bq_client)
+        # Extracting and loading the work units, on the client's loop keeping its connections open
+        watermarks, errors = meta_client.run(
+            load_units_async(
+                ad_account_ids,
+                meta_client,
+                bq_client,
+                bq_project_id,
+                load_dataset,
+                start,
+                end,
+                window,
+                append_method,
+                chunk_days,
+                checkpoints,
+                job_id,
+                progress,
+                flush_rows,
+                rollups,
+                rollup_reach
+            )
         )
+        # The dataset's tables are only replaced once every account is loaded
+        if staged:
+            if errors:
+                raise errors[0]
+            swap_tables(bq_client, bq_project_id, load_dataset, bq_dataset, tables)
+    finally:
+        if staged:
+            bq_client.delete_dataset(f'{bq_project_id}.{load_dataset}', delete_contents=True, not_found_ok=True)
+    # Watermarks of the accounts loaded, truncated tables keeping only the accounts of the job
+    write_watermarks(
+        bq_client,
+        bq_project_id,
+        bq_dataset,
+        watermarks,
+        replace_tables=['campaigns', 'adsets', 'ads', 'insights_ads'] if write_mode == 'truncate' and not resumed else None
     )
-    # Loading tables to BigQuery
-    dict_tables = {
-        'campaigns': df_campaigns,
-        'adsets': df_adsets,
-        'ads': df_ads,
-        'insights_ads': df_insights
-    }
-    for table, df in dict_tables.items():
-        df_to_bq(
-            table_id=f'{bq_project_id}.{bq_dataset}.{table}', 
-            df=df, 
-            write_mode=write_mode,
-            client=bq_client
-        )
-        print(f'Table {bq_project_id}.{bq_dataset}.{table} loaded.')
+    if errors:
+        raise errors[0]
+    if checkpoints:
+        checkpoints.finish(job_id)
 
 def update(
     meta_client, 
     bq_client, 
     bq_project_id: str, 
     bq_dataset: str, 
-    ad_account_ids: str | list
+    ad_account_ids: str | list,
+    append_method: str = 'load',
+    entity_sync: str = 'incremental',
+    lookback_days: int = 0,
+    start: str = None,
+    new_account_days: int = NEW_ACCOUNT_DAYS,
+    progress=None,
+    flush_rows: int = FLUSH_ROWS,
+    rollups: list = tuple(ROLLUP_LEVELS),
+    rollup_reach: bool = False
 ):
+    '''
+    Appends the new days of insights and syncs the entity tables of a BQ dataset.
+    Each ad account resumes from its own watermark, accounts already updated until yesterday are skipped.
+    entity_sync: 'incremental' fetches only the entities updated since the last sync and merges them,
+    'full' downloads every entity of the accounts again and replaces theirs.
+    lookback_days: days until yesterday pulled again to pick up the conversions Meta restates.
+    The insights extracted replace the stored ones through a MERGE on (date, ad_id) limited to
+    their date partitions and accounts, so reruns are idempotent. The insights tables being
+    merged, append_method only applies to load.
+    start: first date loaded for the accounts without a watermark.
+    new_account_days: days until yesterday loaded for the accounts without a watermark if start is None.
+    progress: callback(message, rows) reporting the steps and rows loaded.
+    flush_rows: rows of the micro-batches loaded while the other accounts are extracted (see stream_to_bq_async).
+    rollups/rollup_reach: insights levels rolled up with the ad insights, see load.
+    '''
+    if entity_sync not in ['incremental', 'full']:
+        raise ValueError("Insert a valid entity sync, 'incremental' or 'full'.")
+    if lookback_days < 0:
+        raise ValueError('lookback_days must be zero or positive.')
+    if new_account_days < 1:
+        raise ValueError('new_account_days must be positive.')
+    check_levels(rollups)
+    ad_account_ids = check_account_ids(ad_account_ids)
     utc_minus_3 = timezone(timedelta(hours=-3))
     yesterday = datetime.strftime(datetime.now(utc_minus_3) - timedelta(days=1), format='%Y-%m-%d')
-    query = f'''
-    SELECT
-        MAX(date) AS last_upd
-    FROM {bq_project_id}.{bq_dataset}.insights_ads
-    '''
-    df_insights_upd = bq_client.query(query=query).to_dataframe()
-    last_upd = df_insights_upd['last_upd'][0]
-    start = datetime.strftime(last_upd + timedelta(days=1), format='%Y-%m-%d')
-    
-    if last_upd < datetime.strptime(yesterday, '%Y-%m-%d'):
-        # Extracting data to dataframes
-        df_campaigns, df_adsets, df_ads, df_insights = asyncio.run(
-            extract_accounts_async(
-                ad_account_ids, 
-                meta_client, 
-                start
-            )
-        )
-        # Loading tables to BigQuery
-        dict_tables = {
-            'campaigns': df_campaigns,
-            'adsets': df_adsets,
-            'ads': df_ads,
-            'insights_ads': df_insights
+    yesterday_date = datetime.strptime(yesterday, '%Y-%m-%d')
+    watermarks = read_watermarks(bq_client, bq_project_id, bq_dataset)
+
+    # First date to extract for each ad account
+    starts = {}
+    new_ids = []
+    for account_id in ad_account_ids:
+        last_upd = watermarks.get('insights_ads', {}).get(account_id)
+        if last_upd is None:
+            new_ids.append(account_id)
+            if start:
+                account_start = datetime.strptime(start, '%Y-%m-%d')
+            else:
+                account_start = yesterday_date - timedelta(days=new_account_days - 1)
+        elif last_upd > yesterday_date:
+            print(f'Ad account {account_id} last update greater that yesterday!!! That should not happen!')
+            continue
+        else:
+            account_start = last_upd + timedelta(days=1)
+        if lookback_days:
+            account_start = min(account_start, yesterday_date - timedelta(days=lookback_days - 1))
+        if account_start > yesterday_date:
+            print(f'Ad account {account_id} insights already updated until yesterday.')
+            continue
+        starts[account_id] = datetime.strftime(account_start, format='%Y-%m-%d')
+    if new_ids:
+        since = start if start else f'{new_account_days} days ago'
+        message = f"Ad accounts without a watermark loaded from {since}: {', '.join(new_ids)}."
+        print(message)
+        if progress:
+            progress(message)
+    if not starts:
+        if progress:
+            progress('Every ad account already updated until yesterday.')
+        return
+
+    # Entities are synced incrementally from their watermarks, or fully for the accounts updated
+    updated_since = {}
+    if entity_sync == 'incremental':
+        updated_since = {
+            table: {account_id: watermark - ENTITY_SYNC_OVERLAP for account_id, watermark in watermarks[table].items()}
+            for table in ['campaigns', 'adsets', 'ads'] if table in watermarks
         }
-        for table, df in dict_tables.items():
-            df_to_bq(
-                table_id=f'{bq_project_id}.{bq_dataset}.{table}', 
-                df=df, 
-                write_mode='truncate' if table != 'insights_ads' else 'append',
-                client=bq_client
+    for table in ['insights_ads'] + [ROLLUP_LEVELS[level]['table'] for level in rollups]:
+        ensure_partitioned_table(f'{bq_project_id}.{bq_dataset}.{table}', table, bq_client)
+    for table in ['campaigns', 'adsets', 'ads']:
+        ensure_table(f'{bq_project_id}.{bq_dataset}.{table}', table, bq_client)
+
+    async def extract_unit(account_id, put):
+        # The other accounts' entities are kept, merging into the tables
+        dict_tables = account_entities(entities, account_id)
+        batch = {
+            'tables': dict_tables,
+            'write_modes': {table: 'merge' for table in dict_tables},
+            'watermarks': {table: updated_time_watermarks(df).get(account_id) for table, df in dict_tables.items()}
+        }
+        if entity_sync == 'full':
+            batch['replace_filters'] = {table: f"T.account_id = '{account_id}'" for table in dict_tables}
+        await put(batch)
+        df_insights = await meta_client.df_from_ad_insights_async(
+            start=starts[account_id],
+            end=yesterday,
+            ad_account_id=account_id
+        )
+        dict_tables = await insights_tables_async(
+            meta_client, df_insights, hierarchy, rollups, rollup_reach, starts[account_id], yesterday, account_id
+        )
+        # The days extracted replace their partitions for the account only, so a batch loaded
+        # while another table of its account failed isn't duplicated when the days are pulled again
+        days_filter = f"DATE(T.date) BETWEEN '{starts[account_id]}' AND '{yesterday}' AND T.account_id = '{account_id}'"
+        await put({
+            'tables': dict_tables,
+            'write_modes': {table: 'merge' for table in dict_tables},
+            'replace_filters': {table: days_filter for table in dict_tables},
+            'watermarks': {'insights_ads': yesterday_date}
+        })
+
+    async def extract_load():
+        nonlocal entities, hierarchy
+        try:
+            entities = await fetch_entities_async(meta_client, list(starts), updated_since)
+            # Incremental syncs only fetch the ads updated, the others are read back
+            if rollups:
+                stored_ids = list(starts) if entity_sync == 'incremental' else []
+                hierarchy = ad_hierarchy(
+                    await asyncio.to_thread(read_ad_hierarchy, bq_client, bq_project_id, bq_dataset, stored_ids),
+                    *entities['ads'][0].values()
+                )
+            return await stream_to_bq_async(
+                list(starts),
+                extract_unit,
+                bq_client,
+                bq_project_id,
+                bq_dataset,
+                append_method=append_method,
+                flush_rows=flush_rows,
+                progress=progress
             )
-    elif last_upd == datetime.strptime(yesterday, '%Y-%m-%d'):
-        print('Insights already updated until yesterday.')
-    else:
-        print('Last update greater that yesterday!!! That should not happen!')
\ No newline at end of file
+        finally:
+            await meta_client.aclose()
+
+    # Extracting the accounts and loading them to BigQuery as they're extracted
+    if progress:
+        progress(f'Extracting and loading {len(starts)} ad accounts.')
+    entities = {}
+    hierarchy = None
+    with metrics.span('extract_load'):
+        new_watermarks, errors = meta_client.run(extract_load())
+    # Only the accounts fully loaded move their watermarks forward, a rollup table failing
+    # with its insights_ads loaded would otherwise miss those days for good
+    for table in list(new_watermarks):
+        new_watermarks[table] = {id: watermark for id, watermark in new_watermarks[table].items() if id not in errors}
+    write_watermarks(bq_client, bq_project_id, bq_dataset, new_watermarks)
+    if errors:
+        raise next(iter(errors.values()))
@@ -1,12 +1,356 @@
 # Importing libraries
-import requests
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import json
+from datetime import datetime, timedelta
+import threading
+import time
+import aiohttp
+import yarl
+from urllib.parse import urlencode
+import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.ipc
 from table_schemas import *
+from page_cache import PageCache
+from page_size import PageSizer
+from schema_enforcement import compiled
+from metrics import metrics
+from throttling import UsageScheduler, APP_THROTTLE_ERROR_CODES, graph_error_code
+from retries import RetryPolicy, GraphAPIError, classify_error
+
+class GraphResponse:
+    '''Response returned by the client's transport, read while the connection was open.'''
+    def __init__(self, status_code: int, text: str, headers, elapsed: float = None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        # Seconds the request took once sent, None for the responses of a batch request
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.text)
+
+def date_windows(start: str, end: str, days: int = None):
+    '''
+    Splits the start/end date range in consecutive windows of the given number of days.
+    Returns a list of (start, end) date string tuples, a single window if days is None.
+    '''
+    if days is None:
+        return [(start, end)]
+    window_start = datetime.strptime(start, '%Y-%m-%d')
+    range_end = datetime.strptime(end, '%Y-%m-%d')
+    windows = []
+    while window_start <= range_end:
+        window_end = min(window_start + timedelta(days=days - 1), range_end)
+        windows.append((window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+async def merge_async_iterators(iterators: list, max_workers: int):
+    '''
+    Consumes up to max_workers async iterators at once.
+    Yields (index, item) tuples as the items arrive, index being the iterator's position in the list.
+    '''
+    queue = asyncio.Queue(maxsize=max_workers)
+    workers = asyncio.Semaphore(max_workers)
+    done = object()
+
+    async def drain(index, iterator):
+        error = None
+        try:
+            async with workers:
+                async for item in iterator:
+                    await queue.put((index, item, None))
+        except Exception as exception:
+            error = exception
+        await queue.put((index, done, error))
+
+    tasks = [asyncio.create_task(drain(index, iterator)) for index, iterator in enumerate(iterators)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            index, item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is done:
+                remaining -= 1
+            else:
+                yield index, item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def batch_frames(pages, normalize, batch_pages: int):
+    '''
+    Normalizes an async iterator of pages in batches of batch_pages pages, yielding one dataframe per batch.
+    normalize: coroutine function turning a batch of rows into a dataframe. The next batch
+    is fetched while the previous one is normalized.
+    '''
+    batch = []
+    pages_in_batch = 0
+    pending = None
+    async for data in pages:
+        batch.extend(data)
+        pages_in_batch += 1
+        if pages_in_batch == batch_pages:
+            if pending is not None:
+                yield await pending
+            pending = asyncio.ensure_future(normalize(batch))
+            batch, pages_in_batch = [], 0
+    if pending is not None:
+        yield await pending
+    if batch:
+        yield await normalize(batch)
+
+def concat_frames(frames: list):
+    '''Concatenates batch dataframes, returning an empty dataframe if none has rows.'''
+    frames = [df for df in frames if df.shape[0] > 0]
+    with metrics.span('concat'):
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# Raw insights row layout, numbers come as strings from the API
+ACTIONS_TYPE = pyarrow.list_(pyarrow.struct([('action_type', pyarrow.string()), ('value', pyarrow.string())]))
+VIDEO_FIELDS = [f'video_p{percent}_watched_actions' for percent in [25, 50, 75, 95, 100]]
+INSIGHTS_ROW_SCHEMA = pyarrow.schema(
+    [(field, pyarrow.string()) for field in [
+        'date_start',
+        'account_id',
+        'account_name',
+        'ad_id',
+        'ad_name',
+        'objective',
+        'optimization_goal',
+        'impressions',
+        'reach',
+        'spend'
+    ]]
+    + [('actions', ACTIONS_TYPE)]
+    + [(field, ACTIONS_TYPE) for field in VIDEO_FIELDS]
+)
+
+# Fields and pandera schemas of the entity edges
+ENTITY_FIELDS = {
+    'campaigns': [
+        'account_id',
+        'id',
+        'name',
+        'status',
+        'created_time',
+        'updated_time',
+        'objective',
+        'source_campaign_id',
+        'boosted_object_id'
+    ],
+    'adsets': [
+        'account_id',
+        'created_time',
+        'end_time',
+        'updated_time',
+        'id',
+        'name',
+        'status',
+        'campaign_id',
+        'billing_event',
+        'daily_budget',
+        'destination_type',
+        'optimization_goal',
+        'promoted_object{pixel_id,custom_event_type}',
+        'source_adset_id'
+    ],
+    'ads': [
+        'account_id',
+        'created_time',
+        'id',
+        'adset_id',
+        'campaign_id',
+        'status',
+        'name',
+        'updated_time',
+        'ad_active_time',
+        'creative{id}',
+        'source_ad_id',
+        'preview_shareable_link'
+    ]
+}
+ENTITY_SCHEMAS = {
+    'campaigns': campaigns_schema,
+    'adsets': adsets_schema,
+    'ads': ads_schema
+}
+
+# Requests packed in a Graph API batch request at most
+MAX_BATCH_REQUESTS = 50
+
+def _action_values(column: pyarrow.ChunkedArray, rows: int, action_types: list):
+    '''
+    Pivots a list<struct<action_type, value>> column into one int64 array per action type.
+    Rows without the action get 0. With action_types None, the first value of each list is returned.
+    '''
+    column = column.combine_chunks()
+    parents = pc.list_parent_indices(column).to_numpy()
+    actions = pc.list_flatten(column)
+    values = pc.cast(pc.struct_field(actions, 'value'), pyarrow.float64()).fill_null(0).to_numpy()
+    values = values.astype(np.int64)
+    if action_types is None:
+        first = np.ones(len(parents), dtype=bool)
+        first[1:] = parents[1:] != parents[:-1]
+        result = np.zeros(rows, dtype=np.int64)
+        result[parents[first]] = values[first]
+        return result
+    # Column names have dots replaced, e.g. offsite_conversion.fb_pixel_purchase
+    types = pc.replace_substring(pc.struct_field(actions, 'action_type'), '.', '_')
+    pivoted = {}
+    for action_type in action_types:
+        mask = pc.equal(types, action_type).fill_null(False).to_numpy(zero_copy_only=False)
+        result = np.zeros(rows, dtype=np.int64)
+        result[parents[mask]] = values[mask]
+        pivoted[action_type] = result
+    return pivoted
+
+def ad_insights_to_df(data: list, validation: str = 'fast'):
+    '''
+    Takes ad level insights rows and returns a validated dataframe.
+    Rows are converted to Arrow columns at once and actions pivoted with vectorized masks.
+    validation: how the schema is enforced, see schema_enforcement.CompiledSchema.validate.
+    '''
+    if len(data) == 0:
+        return pd.DataFrame()
+    with metrics.span('normalize', table='insights_ads'):
+        df = _insights_columns(data)
+    with metrics.span('validate', table='insights_ads'):
+        return compiled(insights_ads_schema).validate(df, validation)
+
+def _insights_columns(data: list):
+    '''Returns the dataframe of raw insights rows, before the schema is enforced.'''
+    table = pyarrow.Table.from_pylist(data, schema=INSIGHTS_ROW_SCHEMA)
+    rows = table.num_rows
+    # Only the actions kept by the schema are pivoted, the others would be filtered out
+    action_columns = [col_name for col_name in insights_ads_schema.columns if col_name.startswith('action_')]
+    actions = _action_values(table['actions'], rows, [col_name[len('action_'):] for col_name in action_columns])
+    columns = {
+        'date': pd.to_datetime(table['date_start'].to_pandas()),
+        'account_id': table['account_id'].to_pandas(),
+        'account_name': table['account_name'].to_pandas(),
+        'ad_id': table['ad_id'].to_pandas(),
+        'ad_name': table['ad_name'].to_pandas(),
+        'objective': table['objective'].to_pandas(),
+        'optimization_goal': table['optimization_goal'].to_pandas(),
+        'impressions': pc.cast(table['impressions'], pyarrow.int64()).fill_null(0).to_numpy(),
+        'reach': pc.cast(table['reach'], pyarrow.int64()).fill_null(0).to_numpy()
+    }
+    for field in VIDEO_FIELDS:
+        columns[field] = _action_values(table[field], rows, None)
+    columns['spend'] = pc.cast(table['spend'], pyarrow.float64()).to_numpy()
+    for col_name in action_columns:
+        columns[col_name] = actions[col_name[len('action_'):]]
+    return pd.DataFrame(columns)
+
+def entities_to_df(data: list, schema, validation: str = 'fast', table: str = None):
+    '''
+    Takes campaigns, adsets or ads rows and returns a dataframe validated by the schema.
+    table: name of the entity table, labelling the timings of the stages.
+    '''
+    with metrics.span('normalize', table=table):
+        df = pd.json_normalize(data)
+        df.columns = [col_name.replace('.', '_') for col_name in df.columns]
+    if df.shape == (0, 0):
+        return pd.DataFrame()
+    with metrics.span('validate', table=table):
+        return compiled(schema).validate(df, validation)
+
+def normalize_rows(edge: str, data: list, validation: str = 'fast'):
+    'Normalizes and validates the raw rows of an edge, \'insights\' or an entity edge, into a dataframe.'
+    if edge == 'insights':
+        return ad_insights_to_df(data, validation)
+    return entities_to_df(data, ENTITY_SCHEMAS[edge], validation, edge)
+
+def normalize_to_ipc(edge: str, data: list, validation: str = 'fast'):
+    '''
+    Worker process version of normalize_rows: the dataframe is returned as Arrow IPC stream
+    bytes, cheaper to send back than a pickled dataframe.
+    '''
+    table = pyarrow.Table.from_pandas(normalize_rows(edge, data, validation), preserve_index=False)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def frame_from_ipc(buffer: bytes):
+    'Reads a dataframe written by normalize_to_ipc.'
+    return pyarrow.ipc.open_stream(buffer).read_all().to_pandas()
 
 class MetaClient:
-    def __init__(self, token: str = None):
+    def __init__(
+        self,
+        token: str = None,
+        max_connections: int = 100,
+        max_connections_per_host: int = 50,
+        async_report_rows: int = 50000,
+        max_report_runs: int = 10,
+        shard_rows: int = 10000,
+        scheduler: UsageScheduler = None,
+        max_throttle_retries: int = 5,
+        retry: RetryPolicy = None,
+        page_sizer: PageSizer = None,
+        batch_pages: int = 50,
+        cache: PageCache = None,
+        normalize_processes: int = 0,
+        validation: str = 'fast',
+        base_url: str = 'https://graph.facebook.com/v22.0',
+        verbose: bool = False
+    ):
+        '''
+        token: Meta access token.
+        max_connections: total connections kept open in the client's pool.
+        max_connections_per_host: connections allowed to a single host.
+        async_report_rows: estimated rows (days x ads) above which insights use async report runs.
+        max_report_runs: async report runs allowed to be running at the same time.
+        shard_rows: target estimated rows per window when insights are sharded with window='adaptive'.
+        scheduler: rate limit aware scheduler, can be shared between clients of the same app.
+        max_throttle_retries: times a throttled request is retried once its account/app resumes.
+        retry: backoff of the requests failed temporarily (5xx, transient errors), a failed page
+        being retried alone from its cursor.
+        page_sizer: adaptive page sizes learned per ad account and endpoint, can be shared between
+        clients and saved across runs; by default learned for the client's life.
+        batch_pages: pages normalized and validated together, bounding the memory used by raw rows.
+        cache: disk cache of the raw insights rows of each day, read before calling the API.
+        normalize_processes: worker processes normalizing and validating the fetched pages, so the
+        CPU bound work uses several cores; 0 normalizes in the event loop's thread.
+        validation: 'fast' enforces the table schemas with their compiled version, 'sample' also
+        validates a sample of each batch with pandera and 'strict' validates every row with pandera.
+        base_url: Graph API root, versioned (e.g. a local fake API for benchmarks).
+        verbose: prints the progress of every page fetched.
+        '''
         self.token = token
-        self.url = 'https://graph.facebook.com/v22.0'
+        self.url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.async_report_rows = async_report_rows
+        self.max_report_runs = max_report_runs
+        self.shard_rows = shard_rows
+        self.scheduler = scheduler if scheduler else UsageScheduler()
+        self.max_throttle_retries = max_throttle_retries
+        self.retry = retry if retry else RetryPolicy()
+        self.page_sizer = page_sizer if page_sizer else PageSizer()
+        self.batch_pages = batch_pages
+        self.cache = cache
+        self.normalize_processes = normalize_processes
+        self.validation = validation
+        self._process_pool = None
+        self._pool_lock = threading.Lock()
+        self.verbose = verbose
+        self._ad_counts = {}
+        # One connection pool per event loop
+        self._loops = {}
+        # Long-lived event loop run by a thread of the client, keeping its pool open across jobs,
+        # also running the sync wrappers so close() releases their pool from any thread
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
         if not self.token:
             raise ValueError('Please, insert an access token.')        
         url = self.url + '/me'
@@ -14,15 +358,297 @@ class MetaClient:
             'fields': 'id,name',
             'access_token': self.token
         }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
+        try:
+            response = self._run(self._get(url, params=params))
+            if response.status_code != 200:
+                raise PermissionError(f'API response: {response.text}')
+        except BaseException:
+            # The loop and pool of a client failing to validate its token are released at once
+            self.close()
+            raise
+        response_json = response.json()
+        self.user_id = response_json['id']
+        self.user_name = response_json['name']
+
+    def _run(self, coro):
+        '''Runs a coroutine of a sync wrapper on the client's long-lived event loop, reusing its connection pool.'''
+        return self.run(coro)
+
+    def run(self, coro):
+        '''
+        Runs a coroutine on the client's long-lived event loop, from any thread, and returns its result.
+        The connection pool of that loop stays open between the calls, e.g. the jobs using the client.
+        '''
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name='meta-client-loop', daemon=True)
+                self._loop_thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def _loop_state(self):
+        '''Returns the state (session, semaphores...) bound to the running event loop.'''
+        return self._loops.setdefault(asyncio.get_running_loop(), {})
+
+    def _session(self):
+        '''Returns the keep-alive session of the running event loop, creating it if needed.'''
+        state = self._loop_state()
+        session = state.get('session')
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=60
+            )
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            state['session'] = session
+        return session
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        data: dict = None,
+        account_id: str = None,
+        retry_timeouts: bool = True
+    ):
+        '''
+        Sends a request through the pooled session, when the scheduler allows one for the ad account.
+        Throttled requests are retried after the pause set by the scheduler, up to max_throttle_retries
+        times, and temporary failures (5xx, transient errors, network errors) after the backoff of
+        the retry policy. Returns the last response, raising the network error once out of retries.
+        retry_timeouts: False raises timeouts at once, e.g. for a page retried smaller instead.
+        '''
+        # Paging urls come already encoded from the API
+        url = url if params else yarl.URL(url, encoded=True)
+        throttles = 0
+        retries = 0
+        while True:
+            waiting = time.perf_counter()
+            try:
+                async with self.scheduler.slot(account_id):
+                    metrics.observe('scheduler_wait', time.perf_counter() - waiting, account_id)
+                    with metrics.span('http_request', account_id, method=method):
+                        sent = time.perf_counter()
+                        async with self._session().request(method, url, params=params, data=data) as raw_response:
+                            text = await raw_response.text()
+                            response = GraphResponse(
+                                raw_response.status,
+                                text,
+                                raw_response.headers,
+                                time.perf_counter() - sent
+                            )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.inc('requests_total', account_id=account_id, status='network_error')
+                if retries >= self.retry.max_retries or (isinstance(e, asyncio.TimeoutError) and not retry_timeouts):
+                    raise
+                print(f"Request of {f'act_{account_id}' if account_id else 'app'} failed ({type(e).__name__}), retrying.")
+                await asyncio.sleep(self.retry.delay(retries))
+                retries += 1
+                metrics.inc('retries_total', account_id=account_id, reason='network')
+                continue
+            metrics.inc('requests_total', account_id=account_id, status=response.status_code)
+            metrics.inc('response_bytes_total', len(text), account_id=account_id)
+            self.scheduler.update(response.headers, account_id)
+            if response.status_code == 200:
+                self.scheduler.succeeded(account_id)
+                return response
+            try:
+                response_json = response.json()
+            except ValueError:
+                response_json = None
+            kind = classify_error(response.status_code, response_json)
+            if kind == 'throttle' and throttles < self.max_throttle_retries:
+                app = graph_error_code(response_json) in APP_THROTTLE_ERROR_CODES
+                metrics.inc('throttles_total', account_id=account_id, scope='app' if app else 'account')
+                self.scheduler.throttled(response.headers, account_id, app=app)
+                throttles += 1
+                metrics.inc('retries_total', account_id=account_id, reason='throttle')
+            elif kind == 'retryable' and retries < self.retry.max_retries:
+                await asyncio.sleep(self.retry.delay(retries))
+                retries += 1
+                metrics.inc('retries_total', account_id=account_id, reason='error')
+            else:
+                return response
+
+    async def _get(self, url: str, params: dict = None, account_id: str = None, retry_timeouts: bool = True):
+        return await self._request('GET', url, params=params, account_id=account_id, retry_timeouts=retry_timeouts)
+
+    async def _post(self, url: str, data: dict, account_id: str = None):
+        data = {key: str(value) for key, value in data.items()}
+        return await self._request('POST', url, data=data, account_id=account_id)
+
+    async def aclose(self):
+        '''
+        Closes the connection pool bound to the running event loop, saving the page sizes learned.
+        The pool of the client's long-lived loop (see run) is kept open until close.
+        '''
+        await asyncio.to_thread(self.page_sizer.save)
+        if asyncio.get_running_loop() is not self._loop:
+            await self._close_session()
+
+    async def _close_session(self):
+        state = self._loops.pop(asyncio.get_running_loop(), {})
+        session = state.get('session')
+        if session is not None:
+            await session.close()
+
+    def close(self):
+        '''
+        Closes the client's long-lived event loop and its connection pool, from any thread,
+        and the worker processes.
+        '''
+        self.page_sizer.save()
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop, self._loop_thread = None, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._close_session(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        with self._pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+                self._process_pool = None
+
+    def _normalizer(self, edge: str):
+        '''Returns the coroutine function normalizing a batch of the edge's rows, in a worker process if enabled.'''
+        if not self.normalize_processes:
+            async def normalize(data):
+                return normalize_rows(edge, data, self.validation)
+            return normalize
+
+        with self._pool_lock:
+            if self._process_pool is None:
+                # Spawned, forking a process running event loops and threads isn't safe
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.normalize_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            pool = self._process_pool
+
+        async def normalize(data):
+            # Spans of the worker processes stay there, the worker time is observed here as a whole
+            with metrics.span('normalize_worker', table=edge):
+                buffer = await asyncio.get_running_loop().run_in_executor(pool, normalize_to_ipc, edge, data, self.validation)
+                return frame_from_ipc(buffer)
+        return normalize
+
+    def _iterate(self, iterator):
+        '''Consumes an async iterator from sync code, on the client's long-lived event loop.'''
+        while True:
+            try:
+                yield self._run(iterator.__anext__())
+            except StopAsyncIteration:
+                break
+
+    async def pages_async(
+        self,
+        url: str,
+        params: dict,
+        account_id: str = None,
+        label: str = '',
+        response: GraphResponse = None,
+        table: str = None
+    ):
+        '''
+        Yields the data of each page of a Graph API edge, following its paging cursors.
+        Each page is retried alone (see _request), paging resuming from its cursor. Raises
+        GraphAPIError if a page still fails, reporting the pages and rows yielded before it.
+        When params set a limit, the page size adapts as pages come (see PageSizer): a page
+        failed for its data volume or timed out is retried with half the limit.
+        response: first page already fetched (e.g. by a batch request), requested otherwise.
+        table: table the rows are counted for in the metrics, the label by default.
+        '''
+        endpoint = table if table else label
+        adaptive = params is not None and 'limit' in params
+        if adaptive:
+            limit = self.page_sizer.limit(account_id, endpoint)
+            params = {**params, 'limit': limit}
+        page = 1
+        rows = 0
+        while True:
+            if response is None:
+                # Paging urls carry the limit of the previous page
+                page_url = url if page == 1 or not adaptive else str(yarl.URL(url, encoded=True).update_query(limit=limit))
+                shrinkable = adaptive and limit > self.page_sizer.min_limit
+                try:
+                    response = await self._get(
+                        page_url,
+                        params=params if page == 1 else None,
+                        account_id=account_id,
+                        retry_timeouts=not shrinkable
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if shrinkable and isinstance(e, asyncio.TimeoutError):
+                        limit = self._shrink_page(account_id, endpoint, label, limit, 'timed out', data_volume=False)
+                        params = {**params, 'limit': limit}
+                        continue
+                    error = GraphAPIError(
+                        f'{type(e).__name__}: {e}',
+                        kind='retryable',
+                        label=label,
+                        account_id=account_id,
+                        pages=page - 1,
+                        rows=rows,
+                        resume_url=url if page > 1 else None
+                    )
+                    metrics.inc('page_failures_total', account_id=account_id, table=endpoint)
+                    raise error from e
+            if response.status_code != 200:
+                error = GraphAPIError.from_response(
+                    response,
+                    label=label,
+                    account_id=account_id,
+                    pages=page - 1,
+                    rows=rows,
+                    resume_url=url if page > 1 else None
+                )
+                if error.kind == 'reduce_data' and adaptive and limit > self.page_sizer.min_limit:
+                    limit = self._shrink_page(account_id, endpoint, label, limit, 'asked too much data')
+                    params = {**params, 'limit': limit}
+                    response = None
+                    continue
+                metrics.inc('page_failures_total', account_id=account_id, table=endpoint)
+                raise error
             response_json = response.json()
-            self.user_id = response_json['id']
-            self.user_name = response_json['name']
-        else:
-            raise PermissionError(f'API response: {response.text}')
-    
+            data = response_json['data']
+            rows += len(data)
+            metrics.inc('pages_total', account_id=account_id, table=endpoint)
+            metrics.inc('rows_fetched_total', len(data), account_id=account_id, table=endpoint)
+            if self.verbose:
+                account = f'act_{account_id} ' if account_id else ''
+                print(f'{account}{label}: page {page}, {len(data)} rows.')
+            if adaptive and response.elapsed is not None:
+                limit = self.page_sizer.record(account_id, endpoint, limit, len(data), response.elapsed, len(response.text))
+            yield data
+            url = response_json.get('paging', {}).get('next')
+            if not url:
+                break
+            response = None
+            page += 1
+
+    def _shrink_page(self, account_id: str, endpoint: str, label: str, limit: int, reason: str, data_volume: bool = True):
+        '''Halves the page size of the account's endpoint after a page failed for its size.'''
+        smaller = self.page_sizer.shrink(account_id, endpoint, limit, data_volume)
+        account = f'act_{account_id} ' if account_id else ''
+        print(f'{account}{label}: page of {limit} rows {reason}, retrying with {smaller}.')
+        metrics.inc('page_shrinks_total', account_id=account_id, table=endpoint)
+        return smaller
+
+    def pages(self, url: str, params: dict, account_id: str = None, label: str = ''):
+        '''Sync version of pages_async.'''
+        return self._iterate(self.pages_async(url, params, account_id, label))
+
     def ad_accounts(self):
+        '''Returns ad accounts ID's and names'''
+        return self._run(self.ad_accounts_async())
+
+    async def ad_accounts_async(self):
         '''Returns ad accounts ID's and names'''
         url = f'{self.url}/{self.user_id}/adaccounts'
         params = {
@@ -30,33 +656,71 @@ class MetaClient:
             'limit': 100,
             'fields': 'name'
         }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            response_json = response.json()
-            data = response_json['data']
-            while True:
-                try:
-                    url = response_json['paging']['next']
-                    response = requests.get(url)
-                    if response.status_code == 200:
-                        response_json = response.json()
-                        data.extend(response_json['data'])
-                    else:
-                        raise ValueError(response.text)
-                except KeyError:
-                    break
-            return data
-        else:
-            raise ValueError(response.text)
+        return [item async for data in self.pages_async(url, params, label='adaccounts') for item in data]
+
+    async def count_ads_async(self, ad_account_id: str):
+        '''Returns the total number of ads in the ad account (cached per client).'''
+        if ad_account_id not in self._ad_counts:
+            url = f'{self.url}/act_{ad_account_id}/ads'
+            params = {
+                'fields': 'id',
+                'summary': 'total_count',
+                'limit': 1,
+                'access_token': self.token
+            }
+            response = await self._get(url, params=params, account_id=ad_account_id)
+            if response.status_code == 200:
+                self._ad_counts[ad_account_id] = response.json().get('summary', {}).get('total_count', 0)
+            else:
+                raise GraphAPIError.from_response(response, label='ads count', account_id=ad_account_id)
+        return self._ad_counts[ad_account_id]
 
-    def call_insights_data(self, level: str, start: str, end: str, ad_account_id: str):
+    async def insights_mode_async(self, start: str, end: str, ad_account_id: str):
+        '''Returns 'async' when the estimated rows (days x ads) justify a report run, else 'sync'.'''
+        days = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days + 1
+        ads = await self.count_ads_async(ad_account_id)
+        return 'async' if days * ads > self.async_report_rows else 'sync'
+
+    def call_insights_data(self, level: str, start: str, end: str, ad_account_id: str, mode: str = 'auto'):
         '''
         Calls insights data from ad account, at the level specified.
         level: 'account', 'ad', 'adset' or 'campaign'.
         start/end: date string in the format 'YYYY-MM-DD'.
+        mode: 'sync' pages /insights directly, 'async' runs a report job, 'auto' picks from the estimated rows.
         '''
+        return self._run(self.call_insights_data_async(level, start, end, ad_account_id, mode))
+
+    async def call_insights_data_async(
+        self,
+        level: str,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto'
+    ):
+        '''Coroutine version of call_insights_data.'''
+        pages = self.insights_pages_async(level, start, end, ad_account_id, mode)
+        return [item async for data in pages for item in data]
+
+    async def insights_pages_async(
+        self,
+        level: str,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto',
+        fields: list = None
+    ):
+        '''
+        Yields insights data page by page (see call_insights_data).
+        With a cache, days all cached are yielded from it (one page per day) and the rows of
+        a range fully fetched are cached by day.
+        fields: insights fields requested, the ones of the insights tables by default.
+        '''
+        if mode not in ['auto', 'sync', 'async']:
+            raise ValueError("Insert a valid insights mode, 'auto', 'sync' or 'async'.")
         url = f'{self.url}/act_{ad_account_id}/insights'
-        fields = [
+        fields = fields if fields else [
             'account_id',
             'account_name',
             f'{level}_id',
@@ -81,195 +745,344 @@ class MetaClient:
             'limit': 100,
             'access_token': self.token
         }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            response_json = response.json()
-            data = response_json['data']
-            while True: 
-                try:
-                    url = response_json['paging']['next']
-                    response = requests.get(url=url)
-                    if response.status_code == 200:
-                        response_json = response.json()
-                        data.extend(response_json['data'])
-                    else:
-                        raise KeyError(response.text)
-                except KeyError:
-                    break
-            return data
-        else:
-            raise KeyError(response.text)
-
-    def df_from_ad_insights(self, start: str, end: str, ad_account_id: str):
-        '''Takes a .json file from insights data and returns a dataframe'''
-        data = self.call_insights_data(level='ad', start=start, end=end, ad_account_id=ad_account_id)
-        normal_data = []
-        if len(data) > 0:
-            for item in data:
-                try: 
-                    action_fields = {f"action_{action['action_type']}": action['value'] for action in item['actions']}
-                except KeyError:
-                    action_fields = {}
-                normal_item = {
-                    'date': item['date_start'],
-                    'account_id': item['account_id'],
-                    'account_name': item['account_name'],
-                    'ad_id': item['ad_id'],
-                    'ad_name': item['ad_name'],
-                    'objective': item['objective'],
-                    'optimization_goal': item['optimization_goal'],
-                    'impressions': item.get('impressions', 0),
-                    'reach': item.get('reach', 0),
-                    'video_p25_watched_actions': item.get('video_p25_watched_actions', [{}])[0].get('value', None),
-                    'video_p50_watched_actions': item.get('video_p50_watched_actions', [{}])[0].get('value', None),
-                    'video_p75_watched_actions': item.get('video_p75_watched_actions', [{}])[0].get('value', None),
-                    'video_p95_watched_actions': item.get('video_p95_watched_actions', [{}])[0].get('value', None),
-                    'video_p100_watched_actions': item.get('video_p100_watched_actions', [{}])[0].get('value', None),
-                    'spend': item['spend']
-                }
-                normal_item.update(action_fields)
-                normal_data.append(normal_item)
-            df = pd.json_normalize(normal_data)
-            df.columns = [col_name.replace('.', '_') for col_name in df.columns]
-            df['date'] = pd.to_datetime(df['date'])
-            df = insights_ads_schema.validate(df)
-            return df
-        else:
-            return pd.DataFrame()
-    
-    def df_from_ads(self, ad_account_id: str):
-        '''Calls data from ads and returns it in a dataframe'''
-        url = f'{self.url}/act_{ad_account_id}/ads'
-        fields = [
-            'account_id',
-            'account_name',
-            'created_time',
-            'id',
-            'adset_id',
-            'campaign_id',
-            'status',
-            'name',
-            'ad_active_time',
-            'creative',
-            'source_ad_id',
-            'preview_shareable_link'
-        ]
-        params = {
-            'fields': ','.join(fields),
-            'date_preset': 'maximum',
-            'limit': 100,
-            'access_token': self.token
-        }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            response_json = response.json()
-            ads_data = response_json['data']
+        days = [day for day, _ in date_windows(start, end, 1)]
+        cache_keys = {day: [ad_account_id, 'insights', level, params['fields'], day] for day in days}
+        if self.cache:
+            # Reading and decompressing the files off the event loop shared by the accounts
+            cached_days = await asyncio.to_thread(lambda: [self.cache.get(cache_keys[day]) for day in days])
+            metrics.inc('cache_days_total', sum(rows is not None for rows in cached_days), result='hit')
+            metrics.inc('cache_days_total', sum(rows is None for rows in cached_days), result='miss')
+            if all(rows is not None for rows in cached_days):
+                for rows in cached_days:
+                    if rows:
+                        yield rows
+                return
+        if mode == 'auto':
+            mode = await self.insights_mode_async(start, end, ad_account_id)
+        if mode == 'async':
+            report_run_id = await self._report_run(url, params, ad_account_id)
+            url = f'{self.url}/{report_run_id}/insights'
+            params = {'limit': 100, 'access_token': self.token}
+        label = f'{level} insights {start} to {end}'
+        table = f'insights_{level}s'
+        day_rows = {day: [] for day in days}
+        pages = self.pages_async(url, params, account_id=ad_account_id, label=label, table=table)
+        try:
+            async for data in pages:
+                if self.cache:
+                    for row in data:
+                        day_rows[row['date_start']].append(row)
+                yield data
+        except GraphAPIError as e:
+            # Still too much data at the smallest page size, the date range is split in two
+            if e.kind != 'reduce_data' or e.partial or len(days) == 1:
+                raise
+            # The smallest pages failing too, the page size wasn't the cause
+            self.page_sizer.reset(ad_account_id, table)
+            middle = len(days) // 2
+            print(f'act_{ad_account_id} {label}: too much data, splitting the date range at {days[middle]}.')
+            for split_start, split_end in [(start, days[middle - 1]), (days[middle], end)]:
+                async for data in self.insights_pages_async(level, split_start, split_end, ad_account_id, mode, fields):
+                    yield data
+            return
+        # Days are only cached when every page was fetched
+        if self.cache:
+            def put_days():
+                for day, rows in day_rows.items():
+                    self.cache.put(cache_keys[day], rows, self.cache.ttl(day))
+            await asyncio.to_thread(put_days)
+
+    async def _report_run(self, url: str, params: dict, ad_account_id: str):
+        '''Submits an async insights report run, waits for it to finish and returns its id.'''
+        state = self._loop_state()
+        if 'report_runs' not in state:
+            state['report_runs'] = asyncio.Semaphore(self.max_report_runs)
+        async with state['report_runs']:
+            response = await self._post(url, data=params, account_id=ad_account_id)
+            if response.status_code != 200:
+                raise GraphAPIError.from_response(response, label='report run', account_id=ad_account_id)
+            report_run_id = response.json()['report_run_id']
+            # Polling the report status with exponential backoff
+            status_params = {
+                'fields': 'async_status,async_percent_completion',
+                'access_token': self.token
+            }
+            delay = 1
             while True:
-                try:
-                    response = requests.get(response_json['paging']['next'])
-                    if response.status_code == 200:
-                        response_json = response.json()
-                        ads_data.extend(response_json['data'])
-                    else:
-                        raise KeyError(response.text)
-                except KeyError:
-                    break
-
-            df = pd.json_normalize(ads_data)
-            df.columns = [col_name.replace('.', '_') for col_name in df.columns]
-            df = ads_schema.validate(df) if df.shape != (0, 0) else pd.DataFrame()
-            return df
+                response = await self._get(
+                    f'{self.url}/{report_run_id}',
+                    params=status_params,
+                    account_id=ad_account_id
+                )
+                if response.status_code != 200:
+                    raise GraphAPIError.from_response(
+                        response,
+                        label=f'report run {report_run_id}',
+                        account_id=ad_account_id
+                    )
+                response_json = response.json()
+                status = response_json['async_status']
+                if status == 'Job Completed' and response_json.get('async_percent_completion') == 100:
+                    return report_run_id
+                if status in ['Job Failed', 'Job Skipped']:
+                    raise RuntimeError(f'Report run {report_run_id} finished with status: {status}')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    async def insights_windows_async(self, start: str, end: str, ad_account_id: str, window: str | int = None):
+        '''
+        Returns the (start, end) windows the insights date range is sharded in.
+        window: None (whole range), 'day', 'week', 'adaptive' (sized by shard_rows and the account's ads) or a number of days.
+        '''
+        if window is None or isinstance(window, int):
+            days = window
+        elif window == 'day':
+            days = 1
+        elif window == 'week':
+            days = 7
+        elif window == 'adaptive':
+            ads = await self.count_ads_async(ad_account_id)
+            days = max(1, self.shard_rows // max(ads, 1))
         else:
-            raise KeyError(response.text)
+            raise ValueError("Insert a valid window, 'day', 'week', 'adaptive' or a number of days.")
+        return date_windows(start, end, days)
 
-    def df_from_adsets(self, ad_account_id: str):
-        '''Calls data from adsets and returns it in a dataframe'''
-        url = f'{self.url}/act_{ad_account_id}/adsets'
-        fields = [
-            'account_id',
-            'account_name',
-            'created_time',
-            'end_time',
-            'id',
-            'name',
-            'status',
-            'campaign_id',
-            'billing_event',
-            'daily_budget',
-            'destination_type',
-            'optimization_goal',
-            'promoted_object',
-            'source_adset_id'
+    async def _ad_insights_shards(
+        self,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str,
+        window: str | int
+    ):
+        '''Returns one async iterator of insights dataframes per window of the date range.'''
+        windows = await self.insights_windows_async(start, end, ad_account_id, window)
+        return [
+            batch_frames(
+                self.insights_pages_async('ad', window_start, window_end, ad_account_id, mode),
+                self._normalizer('insights'),
+                self.batch_pages
+            )
+            for window_start, window_end in windows
         ]
+
+    async def iter_ad_insights_async(
+        self,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto',
+        window: str | int = None,
+        max_workers: int = 4
+    ):
+        '''Yields ad insights in dataframe batches, as the windows' pages are fetched (see df_from_ad_insights).'''
+        shards = await self._ad_insights_shards(start, end, ad_account_id, mode, window)
+        async for _, df in merge_async_iterators(shards, max_workers):
+            yield df
+
+    def iter_ad_insights(
+        self,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto',
+        window: str | int = None,
+        max_workers: int = 4
+    ):
+        '''Sync version of iter_ad_insights_async.'''
+        return self._iterate(self.iter_ad_insights_async(start, end, ad_account_id, mode, window, max_workers))
+
+    def df_from_ad_insights(
+        self,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto',
+        window: str | int = None,
+        max_workers: int = 4
+    ):
+        '''
+        Takes a .json file from insights data and returns a dataframe.
+        window: shards the date range (see insights_windows_async), fetching up to max_workers windows at once.
+        '''
+        return self._run(self.df_from_ad_insights_async(start, end, ad_account_id, mode, window, max_workers))
+
+    async def df_from_ad_insights_async(
+        self,
+        start: str,
+        end: str,
+        ad_account_id: str,
+        mode: str = 'auto',
+        window: str | int = None,
+        max_workers: int = 4
+    ):
+        '''Coroutine version of df_from_ad_insights.'''
+        shards = await self._ad_insights_shards(start, end, ad_account_id, mode, window)
+        # Batches are put back in date order
+        shard_frames = [[] for _ in shards]
+        async for index, df in merge_async_iterators(shards, max_workers):
+            shard_frames[index].append(df)
+        return concat_frames([df for frames in shard_frames for df in frames])
+
+    def df_from_insights_reach(self, level: str, start: str, end: str, ad_account_id: str, mode: str = 'sync'):
+        '''
+        Returns the daily reach of the account's adsets, campaigns or the account itself, which
+        can't be summed from the ads' (see rollups.py), with the columns date, {level}_id and reach.
+        '''
+        return self._run(self.df_from_insights_reach_async(level, start, end, ad_account_id, mode))
+
+    async def df_from_insights_reach_async(self, level: str, start: str, end: str, ad_account_id: str, mode: str = 'sync'):
+        '''Coroutine version of df_from_insights_reach.'''
+        id_field = f'{level}_id'
+        pages = self.insights_pages_async(level, start, end, ad_account_id, mode, fields=[id_field, 'reach'])
+        data = [row async for page in pages for row in page]
+        return pd.DataFrame({
+            'date': pd.to_datetime(pd.Series([row['date_start'] for row in data], dtype=object)),
+            id_field: pd.Series([row.get(id_field) for row in data], dtype=object),
+            'reach': pd.to_numeric(pd.Series([row.get('reach') for row in data], dtype=object))
+        })
+
+    def _entity_params(self, edge: str, updated_since=None, ad_account_id: str = None):
+        '''Returns the parameters of an entity edge request, without the access token.'''
         params = {
-            'fields': ','.join(fields),
+            'fields': ','.join(ENTITY_FIELDS[edge]),
             'date_preset': 'maximum',
-            'limit': 100,
-            'access_token': self.token
+            'limit': self.page_sizer.limit(ad_account_id, edge)
         }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            response_json = response.json()
-            adsets = response_json['data']
-            while True:
-                try:
-                    response = requests.get(response_json['paging']['next'])
-                    if response.status_code == 200:
-                        response_json = response.json()
-                        adsets.extend(response_json['data'])
-                    else:
-                        raise KeyError(response.text)
-                except KeyError:
-                    break
-
-            df = pd.json_normalize(adsets)
-            df.columns = [col_name.replace('.', '_') for col_name in df.columns]
-            df = adsets_schema.validate(df) if df.shape != (0, 0) else pd.DataFrame()
-            return df
-        else:
-            raise KeyError(response.text)
+        if updated_since is not None:
+            params['filtering'] = json.dumps([{
+                'field': f'{edge[:-1]}.updated_time',
+                'operator': 'GREATER_THAN',
+                'value': int(pd.Timestamp(updated_since).timestamp())
+            }])
+        return params
 
-    def df_from_campaigns(self, ad_account_id: str):
-        '''Calls data from campaigns and returns it in a dataframe'''
-        url = f'{self.url}/act_{ad_account_id}/campaigns'
-        fields = [
-            'account_id',
-            'account_name',
-            'id',
-            'name',
-            'status',
-            'created_time',
-            'updated_time',
-            'stop_time',
-            'daily_budget',
-            'objective',
-            'source_campaign_id',
-            'boosted_object_id'
-        ]
-        params = {
-            'fields': ','.join(fields),
-            'date_preset': 'maximum',
-            'limit': 100,
+    def _entity_frames(self, edge: str, ad_account_id: str, updated_since=None, response: GraphResponse = None):
+        '''
+        Returns an async iterator of dataframe batches from an ad account's entity edge.
+        updated_since: datetime (UTC), only entities updated after it are fetched if given.
+        response: first page already fetched, by a batch request.
+        '''
+        url = f'{self.url}/act_{ad_account_id}/{edge}'
+        params = {**self._entity_params(edge, updated_since, ad_account_id), 'access_token': self.token}
+        pages = self.pages_async(url, params, account_id=ad_account_id, label=edge, response=response)
+        return batch_frames(pages, self._normalizer(edge), self.batch_pages)
+
+    async def batch_async(self, relative_urls: list):
+        '''
+        Sends up to MAX_BATCH_REQUESTS GET requests to the Graph API in a single batch request.
+        Returns a GraphResponse per request, None for the requests Meta didn't complete.
+        '''
+        if len(relative_urls) > MAX_BATCH_REQUESTS:
+            raise ValueError(f'A batch request takes {MAX_BATCH_REQUESTS} requests at most.')
+        data = {
+            'batch': json.dumps([{'method': 'GET', 'relative_url': url} for url in relative_urls]),
+            'include_headers': 'false',
             'access_token': self.token
         }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            response_json = response.json()
-            campaigns = response_json['data']
-            while True:
-                try:
-                    response = requests.get(response_json['paging']['next'])
-                    if response.status_code == 200:
-                        response_json = response.json()
-                        campaigns.extend(response_json['data'])
-                    else:
-                        raise KeyError(response.text)
-                except KeyError:
-                    break
-
-            df = pd.json_normalize(campaigns)
-            df.columns = [col_name.replace('.', '_') for col_name in df.columns]
-            df = campaigns_schema.validate(df) if df.shape != (0, 0) else pd.DataFrame()
-            return df
-        else:
-            raise KeyError(response.text)
\ No newline at end of file
+        response = await self._post(self.url, data=data)
+        if response.status_code != 200:
+            raise GraphAPIError.from_response(response, label='batch request')
+        return [
+            GraphResponse(item['code'], item['body'], {}) if item else None
+            for item in response.json()
+        ]
+
+    async def entities_batch_async(self, edge: str, ad_account_ids: list, updated_since: dict = None):
+        '''
+        Fetches an entity edge ('campaigns', 'adsets' or 'ads') of several ad accounts, their first
+        pages packed in batch requests and their next pages followed account by account.
+        Requests failed inside a batch are retried alone.
+        updated_since: {account_id: datetime (UTC)}, see df_from_ads.
+        Returns ({account_id: dataframe}, {account_id: GraphAPIError}) for the accounts fetched and failed.
+        '''
+        updated_since = updated_since if updated_since else {}
+        frames = {}
+        errors = {}
+
+        async def fetch_account(ad_account_id, response):
+            if response is not None and response.status_code != 200:
+                response = None
+            try:
+                batches = self._entity_frames(edge, ad_account_id, updated_since.get(ad_account_id), response)
+                frames[ad_account_id] = concat_frames([df async for df in batches])
+            except GraphAPIError as e:
+                errors[ad_account_id] = e
+
+        async def fetch_batch(batch_account_ids):
+            relative_urls = [
+                f'act_{ad_account_id}/{edge}?{urlencode(self._entity_params(edge, updated_since.get(ad_account_id), ad_account_id))}'
+                for ad_account_id in batch_account_ids
+            ]
+            responses = await self.batch_async(relative_urls)
+            await asyncio.gather(*[
+                fetch_account(ad_account_id, response)
+                for ad_account_id, response in zip(batch_account_ids, responses)
+            ])
+
+        await asyncio.gather(*[
+            fetch_batch(ad_account_ids[i:i + MAX_BATCH_REQUESTS])
+            for i in range(0, len(ad_account_ids), MAX_BATCH_REQUESTS)
+        ])
+        return frames, errors
+
+    def entities_batch(self, edge: str, ad_account_ids: list, updated_since: dict = None):
+        '''Sync version of entities_batch_async.'''
+        return self._run(self.entities_batch_async(edge, ad_account_ids, updated_since))
+
+    def iter_ads_async(self, ad_account_id: str, updated_since=None):
+        '''Yields the ad account's ads in dataframe batches'''
+        return self._entity_frames('ads', ad_account_id, updated_since)
+
+    def iter_ads(self, ad_account_id: str, updated_since=None):
+        '''Sync version of iter_ads_async.'''
+        return self._iterate(self.iter_ads_async(ad_account_id, updated_since))
+
+    def df_from_ads(self, ad_account_id: str, updated_since=None):
+        '''
+        Calls data from ads and returns it in a dataframe.
+        updated_since: datetime (UTC), only ads updated after it are fetched if given.
+        '''
+        return self._run(self.df_from_ads_async(ad_account_id, updated_since))
+
+    async def df_from_ads_async(self, ad_account_id: str, updated_since=None):
+        '''Coroutine version of df_from_ads.'''
+        return concat_frames([df async for df in self.iter_ads_async(ad_account_id, updated_since)])
+
+    def iter_adsets_async(self, ad_account_id: str, updated_since=None):
+        '''Yields the ad account's adsets in dataframe batches'''
+        return self._entity_frames('adsets', ad_account_id, updated_since)
+
+    def iter_adsets(self, ad_account_id: str, updated_since=None):
+        '''Sync version of iter_adsets_async.'''
+        return self._iterate(self.iter_adsets_async(ad_account_id, updated_since))
+
+    def df_from_adsets(self, ad_account_id: str, updated_since=None):
+        '''
+        Calls data from adsets and returns it in a dataframe.
+        updated_since: datetime (UTC), only adsets updated after it are fetched if given.
+        '''
+        return self._run(self.df_from_adsets_async(ad_account_id, updated_since))
+
+    async def df_from_adsets_async(self, ad_account_id: str, updated_since=None):
+        '''Coroutine version of df_from_adsets.'''
+        return concat_frames([df async for df in self.iter_adsets_async(ad_account_id, updated_since)])
+
+    def iter_campaigns_async(self, ad_account_id: str, updated_since=None):
+        '''Yields the ad account's campaigns in dataframe batches'''
+        return self._entity_frames('campaigns', ad_account_id, updated_since)
+
+    def iter_campaigns(self, ad_account_id: str, updated_since=None):
+        '''Sync version of iter_campaigns_async.'''
+        return self._iterate(self.iter_campaigns_async(ad_account_id, updated_since))
+
+    def df_from_campaigns(self, ad_account_id: str, updated_since=None):
+        '''
+        Calls data from campaigns and returns it in a dataframe.
+        updated_since: datetime (UTC), only campaigns updated after it are fetched if given.
+        '''
+        return self._run(self.df_from_campaigns_async(ad_account_id, updated_since))
+
+    async def df_from_campaigns_async(self, ad_account_id: str, updated_since=None):
+        '''Coroutine version of df_from_campaigns.'''
+        return concat_frames([df async for df in self.iter_campaigns_async(ad_account_id, updated_since)])
@@ -0,0 +1,126 @@
+# Importing libraries
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'meta_to_bq'
+# Upper bounds (seconds) of the stage duration histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class Metrics:
+    '''
+    Process wide counters and stage timings of the ETL, rendered in the Prometheus text format.
+    Stages (HTTP request, normalize, validate, concat, BigQuery write...) are timed by spans,
+    observed in a histogram by stage and labels and summed by ad account when one is given.
+    Spans can also be exported as trace events (Chrome trace format, readable by Perfetto).
+    Labels of the histograms must have few values (stage, table), ad accounts only label counters.
+    '''
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._trace_file = None
+        self._trace_start = time.perf_counter()
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        '''Adds value to the counter name{labels}.'''
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float, account_id: str = None, **labels):
+        '''Records a stage duration in its histogram, and in the seconds of the ad account if given.'''
+        key = self._key(stage, labels)
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+        if account_id is not None:
+            self.inc('account_stage_seconds_total', seconds, account_id=account_id, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str, account_id: str = None, **labels):
+        '''Times the enclosed block as a stage (see observe), also in async code around awaits.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe(stage, end - start, account_id, **labels)
+            if self._trace_file is not None:
+                self._trace(stage, start, end, account_id, labels)
+
+    def trace_to(self, path: str = None):
+        '''Writes every following span to a trace events file, None stops the export.'''
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+            if path:
+                # The JSON array is left open so spans can be appended, as the trace format allows
+                self._trace_file = open(path, 'w')
+                self._trace_file.write('[\n')
+
+    def _trace(self, stage: str, start: float, end: float, account_id: str, labels: dict):
+        event = {
+            'name': stage,
+            'ph': 'X',
+            'ts': round((start - self._trace_start) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {**labels, 'account_id': account_id} if account_id is not None else labels
+        }
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.write(json.dumps(event, default=str) + ',\n')
+                self._trace_file.flush()
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()):
+        labels = labels + extra
+        if not labels:
+            return ''
+        escaped = [(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    def render(self):
+        '''Returns every metric in the Prometheus text exposition format.'''
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: [list(value[0]), value[1], value[2]] for key, value in self._histograms.items()}
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {PREFIX}_{name} counter')
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f'{PREFIX}_{name}{self._labels(labels)} {value}')
+        if histograms:
+            name = f'{PREFIX}_stage_duration_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for (stage, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+                labels = (('stage', stage),) + labels
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{name}_bucket{self._labels(labels, (("le", str(bound)),))} {bucket_count}')
+                lines.append(f'{name}_bucket{self._labels(labels, (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{self._labels(labels)} {total}')
+                lines.append(f'{name}_count{self._labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+# Registry shared by the MetaClients, jobs and the app of the process
+metrics = Metrics()
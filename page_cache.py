@@ -0,0 +1,126 @@
+# Importing libraries
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Subdirectory of the cache directory holding the cache files, the only ones counted and evicted
+PAGES_DIR = 'meta_pages'
+
+class PageCache:
+    '''
+    Disk cache of raw Graph API rows, one gzipped JSON file per key, in the PAGES_DIR
+    subdirectory of the cache directory. Entries expire after their TTL and the least recently used ones are evicted once
+    the files exceed max_bytes, their size being tracked in memory between the scans.
+    '''
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 1024 ** 3,
+        closed_ttl: float = 30 * 24 * 3600,
+        recent_ttl: float = 3600,
+        closed_after_days: int = 28
+    ):
+        '''
+        path: cache directory, created if needed, the files being kept in its PAGES_DIR subdirectory.
+        max_bytes: size of the cache files above which the least recently used are deleted.
+        closed_ttl: seconds a closed day is kept, its numbers no longer being restated by Meta.
+        recent_ttl: seconds a recent day is kept.
+        closed_after_days: days after which a day is considered closed (Meta's attribution window).
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        self.closed_ttl = closed_ttl
+        self.recent_ttl = recent_ttl
+        self.closed_after_days = closed_after_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dir = os.path.join(path, PAGES_DIR)
+        os.makedirs(self._dir, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        'Returns (mtime, size, path) of the cache files.'
+        entries = []
+        for entry in os.scandir(self._dir):
+            if entry.name.endswith('.json.gz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _file(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self._dir, f'{digest}.json.gz')
+
+    def ttl(self, day: str):
+        '''Returns the seconds an entry of the day (YYYY-MM-DD) is kept.'''
+        closed = datetime.strptime(day, '%Y-%m-%d') < datetime.today() - timedelta(days=self.closed_after_days)
+        return self.closed_ttl if closed else self.recent_ttl
+
+    def get(self, key):
+        '''Returns the rows cached for the key, or None if missing or expired.'''
+        file = self._file(key)
+        try:
+            with gzip.open(file, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is None or entry['expires_at'] < time.time():
+            with self._lock:
+                self.misses += 1
+            return None
+        # The access time orders the eviction, the file may have been evicted by another thread meanwhile
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry['rows']
+
+    def put(self, key, rows: list, ttl: float):
+        '''Stores the rows of the key for ttl seconds.'''
+        file = self._file(key)
+        temp_file = f'{file}.{threading.get_ident()}.tmp'
+        with gzip.open(temp_file, 'wt', encoding='utf-8') as f:
+            json.dump({'expires_at': time.time() + ttl, 'rows': rows}, f, separators=(',', ':'))
+        size = os.path.getsize(temp_file)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(file)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_file, file)
+            self._bytes += size - replaced
+            full = self._bytes > self.max_bytes
+        # The directory is only scanned when the tracked size goes over max_bytes
+        if full:
+            self.evict()
+
+    def evict(self):
+        '''Deletes the least recently used entries until the cache fits in max_bytes.'''
+        with self._lock:
+            entries = self._entries()
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, file in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+            self._bytes = size
+
+    def stats(self):
+        '''Returns the hit and miss counters and the size of the cache files.'''
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self._bytes}
@@ -0,0 +1,111 @@
+# Importing libraries
+import json
+import os
+import threading
+
+class PageSizer:
+    '''
+    Adaptive page size (the limit parameter) of Graph API edges, learned per ad account and endpoint.
+    The limit grows while full pages come back fast and small, shrinks when they get slow or heavy,
+    and is halved after a data volume error or a timeout. The limit of a data volume error becomes
+    a ceiling the limit only grows back to three quarters of. With a path, the learned limits and
+    ceilings are saved to a JSON file so the next runs start from them.
+    '''
+    def __init__(
+        self,
+        path: str = None,
+        initial: int = 100,
+        min_limit: int = 10,
+        max_limit: int = 1000,
+        fast_seconds: float = 2,
+        slow_seconds: float = 20,
+        max_page_bytes: int = 8 * 1024 ** 2
+    ):
+        '''
+        path: JSON file the limits are loaded from and saved to, kept in memory only if None.
+        initial: limit of the accounts and endpoints not learned yet.
+        min_limit/max_limit: bounds of the limit.
+        fast_seconds: response time under which a full page doubles the limit.
+        slow_seconds: response time over which the limit is reduced by a quarter.
+        max_page_bytes: response size over which the limit is reduced by a quarter, pages
+        under half of it being allowed to grow.
+        '''
+        self.path = path
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.fast_seconds = fast_seconds
+        self.slow_seconds = slow_seconds
+        self.max_page_bytes = max_page_bytes
+        self._lock = threading.Lock()
+        # {account_id:endpoint: {'limit': limit, 'ceiling': smallest limit failed}}
+        self._limits = {}
+        self._changed = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._limits = json.load(f)
+            except (OSError, ValueError):
+                print(f'Page sizes of {path} not readable, starting from {initial}.')
+
+    @staticmethod
+    def _key(account_id: str, endpoint: str):
+        return f'{account_id}:{endpoint}'
+
+    def _set(self, key: str, limit: int, ceiling: int = None):
+        entry = self._limits.setdefault(key, {'limit': self.initial, 'ceiling': None})
+        if ceiling is not None and (entry['ceiling'] is None or ceiling < entry['ceiling']):
+            entry['ceiling'] = ceiling
+            self._changed = True
+        maximum = self.max_limit if entry['ceiling'] is None else max(self.min_limit, entry['ceiling'] * 3 // 4)
+        limit = max(self.min_limit, min(maximum, int(limit)))
+        if entry['limit'] != limit:
+            entry['limit'] = limit
+            self._changed = True
+        return limit
+
+    def limit(self, account_id: str, endpoint: str):
+        '''Returns the page size to request from the account's endpoint.'''
+        with self._lock:
+            return self._limits.get(self._key(account_id, endpoint), {}).get('limit', self.initial)
+
+    def record(self, account_id: str, endpoint: str, limit: int, rows: int, seconds: float, size: int):
+        '''Adapts the limit to a page fetched with it, returning the limit of the next page.'''
+        key = self._key(account_id, endpoint)
+        with self._lock:
+            if seconds > self.slow_seconds or size > self.max_page_bytes:
+                return self._set(key, limit * 3 // 4)
+            # Only full pages show that a larger one would have had rows to return
+            if rows >= limit and seconds < self.fast_seconds and size < self.max_page_bytes / 2:
+                return self._set(key, limit * 2)
+            return self._limits.get(key, {}).get('limit', limit)
+
+    def shrink(self, account_id: str, endpoint: str, limit: int, data_volume: bool = True):
+        '''
+        Halves the limit after a data volume error (or a timeout if not data_volume), returning
+        None if already at the minimum.
+        '''
+        if limit <= self.min_limit:
+            return None
+        with self._lock:
+            return self._set(self._key(account_id, endpoint), limit // 2, ceiling=limit if data_volume else None)
+
+    def reset(self, account_id: str, endpoint: str):
+        '''Forgets the limit and ceiling learned, e.g. when the errors came from the query rather than the page size.'''
+        with self._lock:
+            if self._limits.pop(self._key(account_id, endpoint), None) is not None:
+                self._changed = True
+
+    def save(self):
+        '''Writes the learned limits to the JSON file, if any changed.'''
+        if not self.path:
+            return
+        with self._lock:
+            if not self._changed:
+                return
+            limits = dict(self._limits)
+            self._changed = False
+        temp_file = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(limits, f, indent=1, sort_keys=True)
+        os.replace(temp_file, self.path)
@@ -0,0 +1,97 @@
+# Importing libraries
+import random
+from throttling import THROTTLE_ERROR_CODES, graph_error_code
+
+# Graph API error codes of temporary failures, worth retrying as sent
+RETRYABLE_ERROR_CODES = {1, 2}
+# Graph API error codes of requests that can't succeed as sent: invalid parameters or fields,
+# expired or invalid token, missing permissions, unknown objects
+FATAL_ERROR_CODES = {10, 100, 102, 104, 190, 803} | set(range(200, 300))
+
+def classify_error(status_code: int, response_json):
+    '''
+    Classifies a failed Graph API response: 'throttle' (rate limited, paced by the scheduler),
+    'reduce_data' (too much data asked at once, retried with a smaller page or date range),
+    'retryable' (temporary, e.g. a 5xx or an error flagged as transient) or 'fatal'.
+    '''
+    code = graph_error_code(response_json)
+    if code in THROTTLE_ERROR_CODES:
+        return 'throttle'
+    error = response_json.get('error') if isinstance(response_json, dict) else None
+    error = error if isinstance(error, dict) else {}
+    if code == 1 and 'reduce the amount of data' in str(error.get('message', '')):
+        return 'reduce_data'
+    if error.get('is_transient'):
+        return 'retryable'
+    if code in FATAL_ERROR_CODES:
+        return 'fatal'
+    if code in RETRYABLE_ERROR_CODES or status_code is None or status_code >= 500:
+        return 'retryable'
+    return 'fatal'
+
+class RetryPolicy:
+    '''
+    Retries of the requests failed temporarily (5xx, transient Graph API errors, network errors),
+    with exponential backoff and full jitter. Throttling errors are retried by the client after
+    the pause set by its UsageScheduler instead.
+    '''
+    def __init__(self, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60):
+        '''
+        max_retries: times a request is retried before it fails.
+        base_delay: seconds of the first backoff, doubled after each retry.
+        max_delay: longest backoff (seconds).
+        '''
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int):
+        '''Returns the seconds to wait before the retry (0 for the first one), drawn with full jitter.'''
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+class GraphAPIError(KeyError):
+    '''
+    A Graph API request failed after its retries. For a paged edge, reports the pages and rows
+    fetched before the failure and the url of the failed page, from which paging can resume.
+    A KeyError, as raised by the client for failed responses before.
+    '''
+    def __init__(
+        self,
+        text: str,
+        status_code: int = None,
+        kind: str = 'fatal',
+        label: str = '',
+        account_id: str = None,
+        pages: int = 0,
+        rows: int = 0,
+        resume_url: str = None
+    ):
+        super().__init__(text)
+        self.text = text
+        self.status_code = status_code
+        self.kind = kind
+        self.label = label
+        self.account_id = account_id
+        self.pages = pages
+        self.rows = rows
+        self.resume_url = resume_url
+
+    @classmethod
+    def from_response(cls, response, **kwargs):
+        try:
+            kind = classify_error(response.status_code, response.json())
+        except ValueError:
+            kind = classify_error(response.status_code, None)
+        return cls(response.text, status_code=response.status_code, kind=kind, **kwargs)
+
+    @property
+    def partial(self):
+        'Whether pages were fetched before the failure, the data returned so far being incomplete.'
+        return self.pages > 0
+
+    def __str__(self):
+        account = f'act_{self.account_id} ' if self.account_id else ''
+        where = f'{account}{self.label}: ' if account or self.label else ''
+        if self.partial:
+            where += f'failed after {self.pages} pages ({self.rows} rows), '
+        return f'{where}{self.kind} error {self.status_code}: {self.text}'
@@ -0,0 +1,82 @@
+# Importing libraries
+import pandas as pd
+from table_schemas import table_schemas
+from schema_enforcement import compiled
+from metrics import metrics
+
+# Levels rolled up locally from the ad level insights: their table, id column and the
+# columns describing them, the same for every ad of a row
+ROLLUP_LEVELS = {
+    'adset': {
+        'table': 'insights_adsets',
+        'id': 'adset_id',
+        'attributes': ['account_id', 'account_name', 'campaign_id', 'objective', 'optimization_goal']
+    },
+    'campaign': {
+        'table': 'insights_campaigns',
+        'id': 'campaign_id',
+        'attributes': ['account_id', 'account_name', 'objective']
+    },
+    'account': {
+        'table': 'insights_accounts',
+        'id': 'account_id',
+        'attributes': ['account_name']
+    }
+}
+
+# Metrics that can't be summed across ads (a person reached by two ads is counted once),
+# only filled from the API at the level when asked for
+NON_ADDITIVE_METRICS = ['reach']
+
+def check_levels(levels: list):
+    'Raises ValueError if a rollup level is not one of ROLLUP_LEVELS.'
+    for level in levels:
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f"Insert valid rollup levels, among {', '.join(repr(level) for level in ROLLUP_LEVELS)}.")
+
+def ad_hierarchy(*frames):
+    '''
+    Returns the adset_id and campaign_id of each ad, indexed by ad id, from ads dataframes
+    (the ads table layout), the later frames taking precedence.
+    '''
+    frames = [df[['id', 'adset_id', 'campaign_id']] for df in frames if df.shape[0] > 0]
+    if not frames:
+        return pd.DataFrame({'adset_id': [], 'campaign_id': []}, index=pd.Index([], name='id'), dtype=object)
+    return pd.concat(frames, ignore_index=True).drop_duplicates('id', keep='last').set_index('id')
+
+def rollup_insights(df_insights: pd.DataFrame, hierarchy: pd.DataFrame, level: str, df_reach: pd.DataFrame = None):
+    '''
+    Sums ad level insights by date and adset, campaign or account, with one vectorized groupby.
+    hierarchy: adset and campaign of the ads (see ad_hierarchy), unused for the account level.
+    Ads missing from it are summed under a null adset and campaign.
+    df_reach: reach of the level by date and id (see MetaClient.df_from_insights_reach), the
+    reach being left null without it.
+    Returns the dataframe of the level's table.
+    '''
+    config = ROLLUP_LEVELS[level]
+    schema = table_schemas[config['table']]
+    if df_insights.shape[0] == 0:
+        return pd.DataFrame()
+    with metrics.span('rollup', table=config['table']):
+        df = df_insights
+        if level != 'account':
+            ad_ids = df['ad_id']
+            df = df.assign(
+                adset_id=ad_ids.map(hierarchy['adset_id']),
+                campaign_id=ad_ids.map(hierarchy['campaign_id'])
+            )
+            missing = int(df[config['id']].isna().sum())
+            if missing:
+                print(f'{missing} ad insights rows of ads not in the ads table, rolled up without their {level}.')
+        keys = ['date', config['id']]
+        metric_columns = [
+            col_name for col_name in schema.columns
+            if col_name not in keys + config['attributes'] + NON_ADDITIVE_METRICS
+        ]
+        grouped = df.groupby(keys, sort=False, dropna=False)
+        df_rollup = grouped[metric_columns].sum().join(grouped[config['attributes']].first()).reset_index()
+        if df_reach is not None and df_reach.shape[0] > 0:
+            df_rollup = df_rollup.merge(df_reach[keys + ['reach']], on=keys, how='left')
+        df_rollup = df_rollup[[col_name for col_name in schema.columns if col_name in df_rollup.columns]]
+    with metrics.span('validate', table=config['table']):
+        return compiled(schema).validate(df_rollup)
@@ -0,0 +1,109 @@
+# Importing libraries
+import pandas as pd
+
+# Rows validated by pandera in the 'sample' validation mode
+SAMPLE_ROWS = 1000
+
+class CompiledSchema:
+    '''
+    Fast enforcement of a pandera DataFrameSchema (strict='filter', coerce=True, add_missing_columns=True),
+    compiled once from the schema. Adds the missing columns, drops the others, fills defaults and
+    casts every column vectorized, skipping the columns already of their type, and returns the
+    same dataframe as schema.validate without pandera's per-column checks.
+    '''
+    def __init__(self, schema):
+        self.schema = schema
+        self.columns = {}
+        for col_name, column in schema.columns.items():
+            kind = str(column.dtype)
+            if kind not in ['str', 'int64', 'float64', 'datetime64[ns]']:
+                raise ValueError(f"Column '{col_name}' has a type not supported by the compiled schema: {kind}")
+            default = None if pd.isna(column.default) else column.default
+            self.columns[col_name] = (kind, column.nullable, default)
+
+    def _column_order(self, df_columns, absent):
+        '''Column order of pandera's add_missing_columns: the absent columns before the next schema column present.'''
+        schema_columns = dict.fromkeys(col_name for col_name in self.columns if col_name in df_columns or col_name in absent)
+        ordered = []
+        for col_name in df_columns:
+            popped = []
+            for next_col_name in schema_columns:
+                if next_col_name in absent and next_col_name not in ordered:
+                    ordered.append(next_col_name)
+                    popped.append(next_col_name)
+                else:
+                    for popped_col_name in popped:
+                        schema_columns.pop(popped_col_name)
+                    break
+            ordered.append(col_name)
+            schema_columns.pop(col_name, None)
+        ordered.extend(col_name for col_name in absent if col_name not in ordered)
+        return ordered
+
+    @staticmethod
+    def _cast(series: pd.Series, kind: str):
+        if kind == 'str':
+            if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ['string', 'empty']:
+                return series
+            series = series.astype(object)
+            return series.where(series.isna(), series.astype(str))
+        if kind == 'datetime64[ns]':
+            if series.dtype == 'datetime64[ns]':
+                return series
+            series = pd.to_datetime(series)
+            if getattr(series.dtype, 'tz', None) is not None:
+                series = series.dt.tz_convert(None)
+            return series.astype('datetime64[ns]')
+        if series.dtype == kind:
+            return series
+        return series.astype(kind)
+
+    def enforce(self, df: pd.DataFrame):
+        '''Returns the dataframe with the schema enforced. Raises ValueError like schema.validate would.'''
+        absent = [col_name for col_name in self.columns if col_name not in df.columns]
+        for col_name in absent:
+            _, nullable, default = self.columns[col_name]
+            if default is None and not nullable:
+                raise ValueError(f"Column '{col_name}' is missing and has no default value.")
+        columns = {}
+        for col_name in self._column_order(list(df.columns), absent):
+            if col_name not in self.columns:
+                continue
+            kind, nullable, default = self.columns[col_name]
+            if col_name in absent:
+                series = pd.Series(default, index=df.index, dtype=object if default is None else None)
+            else:
+                series = df[col_name]
+                if default is not None and series.hasnans:
+                    series = series.fillna(default)
+            try:
+                series = self._cast(series, kind)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Column '{col_name}' can't be coerced to {kind}: {e}")
+            if not nullable and series.hasnans:
+                raise ValueError(f"Non-nullable column '{col_name}' contains null values.")
+            columns[col_name] = series
+        return pd.DataFrame(columns, index=df.index)
+
+    def validate(self, df: pd.DataFrame, validation: str = 'fast'):
+        '''
+        Enforces the schema on the dataframe.
+        validation: 'fast' (compiled enforcement only), 'sample' (pandera also validates a sample of
+        SAMPLE_ROWS rows, raising its SchemaError) or 'strict' (pandera validates every row).
+        '''
+        if validation == 'strict':
+            return self.schema.validate(df)
+        if validation == 'sample':
+            sample = df.sample(n=min(SAMPLE_ROWS, df.shape[0]), random_state=0) if df.shape[0] else df
+            self.schema.validate(sample)
+        elif validation != 'fast':
+            raise ValueError("Insert a valid validation mode, 'fast', 'sample' or 'strict'.")
+        return self.enforce(df)
+
+_compiled_schemas = {}
+
+def compiled(schema):
+    'Returns the CompiledSchema of a pandera schema, compiling it once.'
+    if id(schema) not in _compiled_schemas:
+        _compiled_schemas[id(schema)] = CompiledSchema(schema)
+    return _compiled_schemas[id(schema)]
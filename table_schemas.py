@@ -18,6 +18,7 @@ adsets_schema = pa.DataFrameSchema({
     "account_id": pa.Column(pa.String),
     "created_time": pa.Column(pa.DateTime),
     "end_time": pa.Column(pa.DateTime, nullable=True),
+    "updated_time": pa.Column(pa.DateTime, nullable=True),
     "id": pa.Column(pa.String),
     "name": pa.Column(pa.String),
     "status": pa.Column(pa.String),
@@ -40,6 +41,7 @@ ads_schema = pa.DataFrameSchema({
     "campaign_id": pa.Column(pa.String),
     "status": pa.Column(pa.String),
     "name": pa.Column(pa.String),
+    "updated_time": pa.Column(pa.DateTime, nullable=True),
     "ad_active_time": pa.Column(pa.Int, nullable=False, default=0),
     "source_ad_id": pa.Column(pa.String, nullable=True),
     "preview_shareable_link": pa.Column(pa.String, nullable=True),
@@ -78,3 +80,52 @@ insights_ads_schema = pa.DataFrameSchema({
     "action_onsite_conversion_post_save": pa.Column(pa.Int, nullable=False, default=0),
     "action_comment": pa.Column(pa.Int, nullable=False, default=0)
 }, strict='filter', coerce=True, add_missing_columns=True)
+
+# Metrics of the ad level insights, summed by the adset, campaign and account rollups
+insights_metrics = {
+    col_name: column for col_name, column in insights_ads_schema.columns.items()
+    if col_name in ["impressions", "spend"] or col_name.startswith(("action_", "video_"))
+}
+
+# Define schemas for the insights tables rolled up from insights_ads. Reach can't be summed
+# across ads, so it's only filled when fetched from the API at the level, and null otherwise
+insights_adsets_schema = pa.DataFrameSchema({
+    "date": pa.Column(pa.DateTime),
+    "account_id": pa.Column(pa.String),
+    "account_name": pa.Column(pa.String),
+    "campaign_id": pa.Column(pa.String, nullable=True),
+    "adset_id": pa.Column(pa.String, nullable=True),
+    "objective": pa.Column(pa.String),
+    "optimization_goal": pa.Column(pa.String),
+    "reach": pa.Column(pa.Float, nullable=True),
+    **insights_metrics
+}, strict='filter', coerce=True, add_missing_columns=True)
+
+insights_campaigns_schema = pa.DataFrameSchema({
+    "date": pa.Column(pa.DateTime),
+    "account_id": pa.Column(pa.String),
+    "account_name": pa.Column(pa.String),
+    "campaign_id": pa.Column(pa.String, nullable=True),
+    "objective": pa.Column(pa.String),
+    "reach": pa.Column(pa.Float, nullable=True),
+    **insights_metrics
+}, strict='filter', coerce=True, add_missing_columns=True)
+
+insights_accounts_schema = pa.DataFrameSchema({
+    "date": pa.Column(pa.DateTime),
+    "account_id": pa.Column(pa.String),
+    "account_name": pa.Column(pa.String),
+    "reach": pa.Column(pa.Float, nullable=True),
+    **insights_metrics
+}, strict='filter', coerce=True, add_missing_columns=True)
+
+# Schemas by BigQuery table name
+table_schemas = {
+    "campaigns": campaigns_schema,
+    "adsets": adsets_schema,
+    "ads": ads_schema,
+    "insights_ads": insights_ads_schema,
+    "insights_adsets": insights_adsets_schema,
+    "insights_campaigns": insights_campaigns_schema,
+    "insights_accounts": insights_accounts_schema
+}
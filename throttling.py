@@ -0,0 +1,179 @@
+# Importing libraries
+import asyncio
+import json
+import threading
+import time
+from contextlib import asynccontextmanager
+
+# Graph API error codes returned when an app, user or ad account is rate limited
+THROTTLE_ERROR_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+APP_THROTTLE_ERROR_CODES = {4}
+
+def graph_error_code(response_json):
+    '''Returns the Graph API error code of a response body, or None.'''
+    try:
+        return response_json['error']['code']
+    except (KeyError, TypeError):
+        return None
+
+def parse_usage_headers(headers):
+    '''
+    Reads Meta's throttling headers from a response.
+    Returns (app_usage, account_usage, regain_seconds): the highest utilization percentages
+    reported for the app and for the ad account (None when not reported), and the seconds
+    until access is regained (0 when not throttled).
+    '''
+    app_usage = None
+    account_usage = None
+    regain_seconds = 0
+
+    def load(name):
+        try:
+            return json.loads(headers.get(name) or 'null')
+        except ValueError:
+            return None
+
+    app = load('X-App-Usage')
+    if app:
+        app_usage = max(app.get(key, 0) for key in ['call_count', 'total_cputime', 'total_time'])
+
+    business = load('X-Business-Use-Case-Usage')
+    if business:
+        for usages in business.values():
+            for usage in usages:
+                pct = max(usage.get(key, 0) for key in ['call_count', 'total_cputime', 'total_time'])
+                account_usage = max(account_usage or 0, pct)
+                regain_seconds = max(regain_seconds, 60 * usage.get('estimated_time_to_regain_access', 0))
+
+    account = load('X-Ad-Account-Usage')
+    if account:
+        account_usage = max(account_usage or 0, account.get('acc_id_util_pct', 0))
+        if account.get('acc_id_util_pct', 0) >= 100:
+            regain_seconds = max(regain_seconds, account.get('reset_time_duration', 0))
+
+    insights = load('x-fb-ads-insights-throttle')
+    if insights:
+        app_usage = max(app_usage or 0, insights.get('app_id_util_pct', 0))
+        account_usage = max(account_usage or 0, insights.get('acc_id_util_pct', 0))
+
+    return app_usage, account_usage, regain_seconds
+
+class UsageScheduler:
+    '''
+    Central request scheduler shared by every account of a MetaClient.
+    Concurrency per ad account and per app is lowered as the usage reported by Meta's
+    throttling headers grows, paused when a limit is hit and restored as usage recovers.
+    '''
+    def __init__(
+        self,
+        max_app_requests: int = 50,
+        max_account_requests: int = 10,
+        slow_down_at: float = 50,
+        stop_at: float = 90,
+        throttle_backoff: float = 30,
+        poll_interval: float = 0.1
+    ):
+        '''
+        max_app_requests/max_account_requests: concurrency allowed while usage is low.
+        slow_down_at: usage (%) from which concurrency is reduced linearly down to one request.
+        stop_at: usage (%) at which only one request at a time is allowed.
+        throttle_backoff: first pause (seconds) after a throttling error without regain time, doubled on repeats.
+        poll_interval: seconds between checks while waiting for a free slot.
+        '''
+        self.max_app_requests = max_app_requests
+        self.max_account_requests = max_account_requests
+        self.slow_down_at = slow_down_at
+        self.stop_at = stop_at
+        self.throttle_backoff = throttle_backoff
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        # Usage and pauses are keyed by ad account id, None being the app itself
+        self._usage = {}
+        self._paused_until = {}
+        self._throttles = {}
+        self._in_flight = {}
+
+    def _limit(self, maximum: int, usage: float):
+        if usage < self.slow_down_at:
+            return maximum
+        if usage >= self.stop_at:
+            return 1
+        scale = (self.stop_at - usage) / (self.stop_at - self.slow_down_at)
+        return max(1, int(maximum * scale))
+
+    def concurrency(self, account_id: str = None):
+        '''Returns the requests currently allowed in flight for the ad account (or the app if None).'''
+        maximum = self.max_account_requests if account_id else self.max_app_requests
+        return self._limit(maximum, self._usage.get(account_id, 0))
+
+    def _wait_time(self, account_id: str):
+        now = time.monotonic()
+        paused_until = max(self._paused_until.get(None, 0), self._paused_until.get(account_id, 0))
+        if paused_until > now:
+            return paused_until - now
+        if self._in_flight.get(None, 0) >= self.concurrency(None):
+            return self.poll_interval
+        if account_id and self._in_flight.get(account_id, 0) >= self.concurrency(account_id):
+            return self.poll_interval
+        return 0
+
+    async def acquire(self, account_id: str = None):
+        '''Waits until a request for the ad account is allowed and reserves its slot.'''
+        while True:
+            with self._lock:
+                wait = self._wait_time(account_id)
+                if wait == 0:
+                    self._in_flight[None] = self._in_flight.get(None, 0) + 1
+                    if account_id:
+                        self._in_flight[account_id] = self._in_flight.get(account_id, 0) + 1
+                    return
+            await asyncio.sleep(wait)
+
+    def release(self, account_id: str = None):
+        with self._lock:
+            self._in_flight[None] -= 1
+            if account_id:
+                self._in_flight[account_id] -= 1
+
+    @asynccontextmanager
+    async def slot(self, account_id: str = None):
+        await self.acquire(account_id)
+        try:
+            yield
+        finally:
+            self.release(account_id)
+
+    def update(self, headers, account_id: str = None):
+        '''Records the usage reported in a response's headers.'''
+        app_usage, account_usage, regain_seconds = parse_usage_headers(headers)
+        with self._lock:
+            if app_usage is not None:
+                self._usage[None] = app_usage
+            if account_id and account_usage is not None:
+                self._usage[account_id] = account_usage
+            if regain_seconds:
+                key = account_id if account_usage is not None else None
+                self._pause(key, regain_seconds)
+
+    def throttled(self, headers, account_id: str = None, app: bool = False):
+        '''Pauses the ad account (or the whole app) after a throttling error.'''
+        _, _, regain_seconds = parse_usage_headers(headers)
+        key = None if app or not account_id else account_id
+        with self._lock:
+            self._throttles[key] = self._throttles.get(key, 0) + 1
+            backoff = self.throttle_backoff * 2 ** (self._throttles[key] - 1)
+            self._pause(key, max(regain_seconds, min(backoff, 900)))
+            self._usage[key] = max(self._usage.get(key, 0), self.stop_at)
+
+    def succeeded(self, account_id: str = None):
+        '''Resets the throttling backoff after a successful response.'''
+        with self._lock:
+            self._throttles.pop(account_id, None)
+            self._throttles.pop(None, None)
+
+    def _pause(self, key, seconds: float):
+        paused_until = time.monotonic() + seconds
+        # Only logged when the pause isn't already covered by a previous one
+        if paused_until > self._paused_until.get(key, 0) + 1:
+            print(f"Throttled {'app' if key is None else f'ad account {key}'}, pausing for {seconds:.0f}s.")
+        self._paused_until[key] = max(self._paused_until.get(key, 0), paused_until)